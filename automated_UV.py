@@ -2,13 +2,9 @@
 
 import os
 import requests
-import logging
-import sys
+from log_setup import get_logger
 
-logger = logging.getLogger(__name__)
-logger.addHandler(logging.FileHandler('keen.log'))
-logger.addHandler(logging.StreamHandler(sys.stdout))
-logging.basicConfig(filename='keen.log', level=logging.INFO)
+logger = get_logger(__name__, 'keen.log')
 
 def get_key():
     # Get the Keen API key from a local file secret.txt
@@ -0,0 +1,39 @@
+# Structural check of an AVIF file from its ISO-BMFF boxes, without decoding it.
+# Shared by verify_output and the checkpoint journal, so it only depends on count_frames'
+# box walker.
+
+import os
+from count_frames import iter_boxes, find_box
+
+
+def read_avif_header(avif_path):
+    """Return (width, height) from the AVIF header, raise ValueError if the file is not a complete AVIF."""
+    with open(avif_path, 'rb') as f:
+        file_size = os.fstat(f.fileno()).st_size
+        boxes = {}
+        end = 0
+        for kind, payload, box_end in iter_boxes(f, 0, file_size):
+            if box_end > file_size:
+                raise ValueError(f'{kind.decode(errors="replace")} box runs past the end of the file (truncated)')
+            boxes.setdefault(kind, (payload, box_end))
+            end = box_end
+        if end != file_size:
+            raise ValueError(f'{file_size - end} trailing bytes after the last box')
+        if b'ftyp' not in boxes:
+            raise ValueError('no ftyp box')
+        f.seek(boxes[b'ftyp'][0])
+        brands = f.read(boxes[b'ftyp'][1] - boxes[b'ftyp'][0])
+        if b'avif' not in brands and b'avis' not in brands:
+            raise ValueError('not an AVIF brand')
+        if b'meta' not in boxes or b'mdat' not in boxes:
+            raise ValueError('missing meta or mdat box')
+        # meta is a full box: skip version/flags, then iprp/ipco/ispe holds the image size
+        meta_start, meta_end = boxes[b'meta']
+        box_range = (meta_start + 4, meta_end)
+        for kind in (b'iprp', b'ipco', b'ispe'):
+            box_range = find_box(f, *box_range, kind) if box_range else None
+        if box_range is None:
+            raise ValueError('no ispe (image size) property')
+        f.seek(box_range[0] + 4)
+        width, height = int.from_bytes(f.read(4), 'big'), int.from_bytes(f.read(4), 'big')
+        return width, height
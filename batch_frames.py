@@ -0,0 +1,186 @@
+# Batch random-access frame extraction.
+# Requests are (video, frame_number, output_file) tuples. They are grouped by video and
+# sorted by frame, each video is opened once, frames close to the current position are
+# read sequentially instead of seeked, and different videos are handled in parallel.
+# Sparse requests use the stream's keyframe positions: a seek only pays off when a
+# keyframe lies between the current position and the target, otherwise frames are grabbed.
+
+import os
+import sys
+import csv
+import bisect
+import logging
+import subprocess
+import cv2
+from concurrent.futures import ProcessPoolExecutor
+from frame_transform import rotate as rotate_frame
+from output_cache import get_cache
+from frame_writer import encode_image
+from fs_utils import atomic_write_bytes
+
+logger = logging.getLogger(__name__)
+
+# targets closer than this many frames ahead are reached with grab() instead of a seek
+SEEK_THRESHOLD = 30
+
+
+def group_requests(requests):
+    """ {video: [(frame_number, [output_file, ...]), ...]} sorted by frame number. """
+    grouped = {}
+    for video, frame_number, output_file in requests:
+        grouped.setdefault(video, {}).setdefault(int(frame_number), []).append(output_file)
+    return {video: sorted(frames.items()) for video, frames in grouped.items()}
+
+
+def get_keyframes(video):
+    """ Frame indices of the keyframes of the first video stream, read from packet flags (demux only, no decode). """
+    cmd = ['ffprobe', '-v', 'error', '-select_streams', 'v:0', '-show_entries', 'packet=flags', '-of', 'csv=p=0', video]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    if result.returncode != 0:
+        return None
+    return [index for index, flags in enumerate(result.stdout.split()) if flags.startswith('K')]
+
+
+def is_sparse(frame_numbers, seek_threshold=SEEK_THRESHOLD):
+    """ True when the sorted frame_numbers are on average further apart than seek_threshold. """
+    if len(frame_numbers) < 2:
+        return True
+    return (frame_numbers[-1] - frame_numbers[0]) / (len(frame_numbers) - 1) > seek_threshold
+
+
+def should_seek(position, frame_number, seek_threshold=SEEK_THRESHOLD, keyframes=None):
+    # seeking backwards is the only way back; forwards it only helps when the decoder can
+    # restart from a keyframe past the current position
+    if frame_number < position:
+        return True
+    if keyframes is not None:
+        nearest = bisect.bisect_right(keyframes, frame_number) - 1
+        return nearest >= 0 and keyframes[nearest] > position
+    return frame_number - position > seek_threshold
+
+
+def read_frames(video, frame_numbers, seek_threshold=SEEK_THRESHOLD, keyframes=None):
+    """ Yield (frame_number, image) for ascending frame_numbers from a single capture, image is None on failure.
+
+    Every frame is decoded into the same array, an image is only valid until the next one is yielded.
+    """
+    vidcap = cv2.VideoCapture(video)
+    position = 0  # index of the frame the next read() returns
+    buffer = None
+    try:
+        for frame_number in frame_numbers:
+            if should_seek(position, frame_number, seek_threshold, keyframes):
+                vidcap.set(cv2.CAP_PROP_POS_FRAMES, frame_number)
+                position = frame_number
+            while position < frame_number and vidcap.grab():
+                position += 1
+            success, image = vidcap.read(image=buffer)
+            position += 1
+            if success:
+                buffer = image
+            yield frame_number, image if success else None
+    finally:
+        vidcap.release()
+
+
+def write_frame(output_file, image):
+    # AVIF goes through PIL with the same settings as convert_png_to_avif, anything else through cv2.
+    # Written through a temp name: output_file may be a hard link into the output cache, and
+    # truncating it in place would change the cached copy too
+    try:
+        atomic_write_bytes(output_file, encode_image(image, os.path.splitext(output_file)[1]))
+    except (OSError, ValueError) as e:
+        logger.error(f'Could not encode {output_file}: {e}')
+        return False
+    return True
+
+
+def cache_params(output_file, rotate):
+    # everything besides source and frame that decides the bytes of an output file
+    ext = os.path.splitext(output_file)[1]
+    params = {'format': ext, 'rotate': 90 if rotate else 0}
+    if ext == '.avif':
+        params['quality'] = 100
+    return params
+
+
+def extract_video_frames(video, targets, rotate=True, seek_threshold=SEEK_THRESHOLD, keyframe_aware=True, use_cache=True):
+    """ Write every (frame_number, [output_file, ...]) target of one video, returns the files written.
+
+    With use_cache, outputs already encoded from the same source (under any path) are linked
+    from the output cache and their frames are not decoded at all.
+    """
+    if not os.path.exists(video):
+        logger.error(f'Video not found: {video}')
+        return []
+    written = []
+    cache = get_cache() if use_cache else None
+    fingerprint = cache.fingerprint(video) if cache else None
+    outputs = {}
+    for frame_number, output_files in targets:
+        for output_file in output_files:
+            if cache and cache.restore(fingerprint, frame_number, cache_params(output_file, rotate), output_file):
+                written.append(output_file)
+            else:
+                outputs.setdefault(frame_number, []).append(output_file)
+    if written:
+        logger.info(f'Linked {len(written)} cached frames of {video}')
+    frame_numbers = sorted(outputs)
+    # dense plans are decoded sequentially, only sparse ones are worth probing for keyframes
+    keyframes = None
+    if keyframe_aware and len(frame_numbers) > 1 and is_sparse(frame_numbers, seek_threshold):
+        keyframes = get_keyframes(video)
+    for frame_number, image in read_frames(video, frame_numbers, seek_threshold, keyframes):
+        if image is None:
+            logger.error(f'Failed to read frame {frame_number} from {video}')
+            continue
+        if rotate:
+            # into a reused buffer, every output of this frame is written before the next read
+            image = rotate_frame(image, 90)
+        for output_file in outputs[frame_number]:
+            os.makedirs(os.path.dirname(output_file) or '.', exist_ok=True)
+            if write_frame(output_file, image):
+                written.append(output_file)
+                if cache:
+                    cache.store(fingerprint, {frame_number: output_file}, cache_params(output_file, rotate))
+            else:
+                logger.error(f'Failed to write frame {frame_number} from {video} to {output_file}')
+    return written
+
+
+def extract_frames_batch(requests, rotate=True, workers=None, seek_threshold=SEEK_THRESHOLD, keyframe_aware=True, use_cache=True):
+    """ Serve many (video, frame_number, output_file) requests with one capture per video, videos in parallel. """
+    grouped = group_requests(requests)
+    written = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(extract_video_frames, video, targets, rotate, seek_threshold, keyframe_aware, use_cache): video
+                   for video, targets in grouped.items()}
+        for future, video in futures.items():
+            try:
+                written.extend(future.result())
+            except BaseException as e:
+                logger.error(f'Error extracting frames from {video}:\n\t{e}')
+    logger.info(f'Wrote {len(written)} frames from {len(grouped)} videos')
+    return written
+
+
+def read_request_csv(csv_path):
+    """ Requests from a CSV with video,frame,output columns (header optional). """
+    requests = []
+    with open(csv_path, newline='') as f:
+        for row in csv.reader(f):
+            if len(row) < 3 or not row[1].strip().isdigit():
+                continue
+            requests.append((row[0].strip(), int(row[1]), row[2].strip()))
+    return requests
+
+
+if __name__ == '__main__':
+    import argparse
+    logging.basicConfig(level=logging.INFO, stream=sys.stdout)
+    parser = argparse.ArgumentParser(description='Extract many frames from many videos, one capture per video.')
+    parser.add_argument('requests_csv', type=str, help='CSV of video,frame,output rows')
+    parser.add_argument('--no-rotate', action='store_true', help='Do not rotate frames 90 degrees clockwise.')
+    parser.add_argument('--workers', type=int, default=None, help='Videos processed in parallel')
+    args = parser.parse_args()
+    extract_frames_batch(read_request_csv(args.requests_csv), not args.no_rotate, args.workers)
@@ -0,0 +1,219 @@
+# Benchmark the extraction paths on synthetic clips.
+# Clips are generated locally with ffmpeg's testsrc2 source at a configurable resolution
+# and length, each extractor runs in its own process, and the results (frames/sec, peak
+# RSS, bytes written, per-stage decode/rotate/encode time) are saved as JSON so runs can
+# be compared over time:
+#   python benchmark_extractors.py --width 3840 --height 2160 --frames 120
+#   python benchmark_extractors.py --compare benchmarks/<old>.json
+
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import resource
+import argparse
+import tempfile
+import subprocess
+import multiprocessing
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks')
+MODEL = 'Model1'
+POSE = 'BENCH_pose'
+# what counts as a frame in an output folder; checkpoint journals and other bookkeeping do not
+FRAME_EXTENSIONS = ('.png', '.avif', '.jpg', '.jpeg')
+
+
+def make_clip(path, width, height, frames, fps=30, kind='mp4'):
+    """ Generate a synthetic H.264 .mp4 or ProRes .mov clip with ffmpeg. """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if kind == 'mp4':
+        codec = ['-c:v', 'libx264', '-pix_fmt', 'yuv420p', '-g', str(fps)]
+    else:
+        codec = ['-c:v', 'prores_ks', '-profile:v', '3', '-pix_fmt', 'yuv422p10le']
+    cmd = ['ffmpeg', '-y', '-v', 'error', '-f', 'lavfi', '-i', f'testsrc2=size={width}x{height}:rate={fps}',
+           '-frames:v', str(frames)] + codec + [path]
+    subprocess.run(cmd, check=True)
+    return path
+
+
+def output_stats(folder):
+    """ (frames, bytes) written under folder; bytes include non-frame files such as journals. """
+    files = total = 0
+    for root, _, names in os.walk(folder):
+        for name in names:
+            if name.lower().endswith(FRAME_EXTENSIONS):
+                files += 1
+            total += os.path.getsize(os.path.join(root, name))
+    return files, total
+
+
+# each runner takes (clip, src_root, out_root) and is called in a fresh process
+
+def _run_export_mp4_to_frames(clip, src, out):
+    from process_mp4 import export_mp4_to_frames
+    export_mp4_to_frames(clip, src, out)
+
+
+def _run_pipelined_video_processor(clip, src, out):
+    from process_mp4 import pipelined_video_processor
+    pipelined_video_processor([clip], src=src, dst=out)
+
+
+def _run_export_prores_to_frames(clip, src, out):
+    from process_mp4 import export_prores_to_frames
+    export_prores_to_frames(clip, src, out, rotate=True)
+
+
+def _run_hyper_extract_frames(clip, src, out):
+    from hyper_prores2avif import extract_frames_streaming
+    extract_frames_streaming(clip, out)
+
+
+def _run_extract_frames_avif(clip, src, out):
+    from mov_to_stills import extract_frames_avif
+    extract_frames_avif(clip, out)
+
+
+EXTRACTORS = {
+    'export_mp4_to_frames': ('mp4', _run_export_mp4_to_frames),
+    'pipelined_video_processor': ('mp4', _run_pipelined_video_processor),
+    'export_prores_to_frames': ('mov', _run_export_prores_to_frames),
+    'hyper_prores2avif.extract_frames': ('mov', _run_hyper_extract_frames),
+    'mov_to_stills.extract_frames_avif': ('mov', _run_extract_frames_avif),
+}
+
+
+def _child(runner, clip, src, out, work_dir, results):
+    # keep logs, the frame index and every cache inside the benchmark folder
+    os.chdir(work_dir)
+    os.environ['FRAME_INDEX_DB'] = os.path.join(work_dir, 'frame_index.sqlite')
+    os.environ['VID_CONVERT_OUTPUT_CACHE'] = os.path.join(work_dir, 'output_cache.sqlite')
+    os.environ['VID_CONVERT_FRAME_COUNTS'] = os.path.join(work_dir, 'frame_counts.json')
+    os.environ['VID_CONVERT_VERIFY_CACHE'] = os.path.join(work_dir, 'verify_cache.json')
+    start = time.perf_counter()
+    error = None
+    try:
+        runner(clip, src, out)
+    except BaseException as e:
+        error = repr(e)
+    elapsed = time.perf_counter() - start
+    # ru_maxrss is KB on Linux, bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    peak_rss = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+                   resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) * scale
+    results.put({'seconds': elapsed, 'peak_rss_bytes': peak_rss, 'error': error})
+
+
+def run_extractor(name, clip, src, work_dir):
+    kind, runner = EXTRACTORS[name]
+    out = os.path.join(work_dir, 'out', name.replace('.', '_')) + '/'
+    shutil.rmtree(out, ignore_errors=True)
+    os.makedirs(out)
+    ctx = multiprocessing.get_context('spawn')
+    results = ctx.Queue()
+    process = ctx.Process(target=_child, args=(runner, clip, src, out, work_dir, results))
+    process.start()
+    result = results.get()
+    process.join()
+    files, written = output_stats(out)
+    result.update({'frames_written': files, 'bytes_written': written,
+                   'frames_per_sec': files / max(result['seconds'], 1e-9)})
+    shutil.rmtree(out, ignore_errors=True)
+    return result
+
+
+def profile_stages(clip, max_frames=None):
+    """ Per-stage time for the OpenCV path: decode, rotate and encode (PNG and AVIF) per frame. """
+    import io
+    import cv2
+    from PIL import Image
+    from frame_transform import rotate
+    stages = {'decode': 0.0, 'rotate': 0.0, 'encode_png': 0.0, 'encode_avif': 0.0}
+    vidcap = cv2.VideoCapture(clip)
+    frames = 0
+    while max_frames is None or frames < max_frames:
+        t0 = time.perf_counter()
+        success, image = vidcap.read()
+        t1 = time.perf_counter()
+        if not success:
+            break
+        rotated = rotate(image, 90)
+        t2 = time.perf_counter()
+        cv2.imencode('.png', rotated)
+        t3 = time.perf_counter()
+        Image.fromarray(cv2.cvtColor(rotated, cv2.COLOR_BGR2RGB)).save(io.BytesIO(), 'AVIF', quality_mode='q', quality_level=100)
+        t4 = time.perf_counter()
+        stages['decode'] += t1 - t0
+        stages['rotate'] += t2 - t1
+        stages['encode_png'] += t3 - t2
+        stages['encode_avif'] += t4 - t3
+        frames += 1
+    vidcap.release()
+    return {'frames': frames, 'seconds': stages,
+            'ms_per_frame': {stage: 1000 * seconds / max(frames, 1) for stage, seconds in stages.items()}}
+
+
+def compare(old_path, new):
+    with open(old_path) as f:
+        old = json.load(f)
+    for name, result in new['extractors'].items():
+        before = old.get('extractors', {}).get(name)
+        if not before or not before.get('frames_per_sec'):
+            continue
+        change = 100 * (result['frames_per_sec'] / before['frames_per_sec'] - 1)
+        print(f'{name:40s} {before["frames_per_sec"]:10.2f} -> {result["frames_per_sec"]:10.2f} frames/sec ({change:+.1f}%)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the frame extractors on synthetic clips.')
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--height', type=int, default=1080)
+    parser.add_argument('--frames', type=int, default=60, help='Frames per synthetic clip')
+    parser.add_argument('--fps', type=int, default=30)
+    parser.add_argument('--extractors', nargs='*', default=list(EXTRACTORS), choices=list(EXTRACTORS))
+    parser.add_argument('--stage-frames', type=int, default=30, help='Frames used for the per-stage profile (0 to skip)')
+    parser.add_argument('--work-dir', type=str, default=None, help='Scratch folder (default: a temp folder, removed afterwards)')
+    parser.add_argument('--output', type=str, default=None, help='Results JSON (default: benchmarks/<timestamp>.json)')
+    parser.add_argument('--compare', type=str, default=None, help='Previous results JSON to compare against')
+    args = parser.parse_args()
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='vid_convert_bench_')
+    src = os.path.join(work_dir, 'src') + '/'
+    clips = {
+        'mp4': make_clip(f'{src}{MODEL}/{POSE}/camera_01-0001.mp4', args.width, args.height, args.frames, args.fps, 'mp4'),
+        'mov': make_clip(f'{src}{MODEL}/{POSE}/camera_01-0001.mov', args.width, args.height, args.frames, args.fps, 'mov'),
+    }
+
+    results = {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'host': platform.node(),
+        'cpu_count': os.cpu_count(),
+        'clip': {'width': args.width, 'height': args.height, 'frames': args.frames, 'fps': args.fps},
+        'extractors': {},
+    }
+    for name in args.extractors:
+        kind = EXTRACTORS[name][0]
+        print(f'Running {name} on {os.path.basename(clips[kind])}...')
+        results['extractors'][name] = result = run_extractor(name, clips[kind], src, work_dir)
+        print(f'  {result["frames_written"]} frames, {result["frames_per_sec"]:.2f} frames/sec, '
+              f'{result["peak_rss_bytes"] / 1e6:.0f} MB peak RSS, {result["bytes_written"] / 1e6:.1f} MB written'
+              + (f', error: {result["error"]}' if result['error'] else ''))
+    if args.stage_frames:
+        results['stages'] = profile_stages(clips['mp4'], args.stage_frames)
+        print('Per-frame stage times (ms):', {k: round(v, 2) for k, v in results['stages']['ms_per_frame'].items()})
+
+    output = args.output or os.path.join(RESULTS_DIR, f'{time.strftime("%Y%m%d-%H%M%S")}.json')
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f'Results saved to {output}')
+    if args.compare:
+        compare(args.compare, results)
+    if not args.work_dir:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+# Pair calibration stills with modeling frames by camera number.
+# Camera IDs are parsed once per name into a dict index, so pairing N calibration stills
+# with M modeling frames is a linear join instead of comparing every pair of names.
+# Supported names:
+#   001-RX0_9990253_C0008.04030868      (calibration stills)
+#   camera_01_M4_EXP_eye_neutral-00003  (modeling frames)
+#   camera_01-EXP_eyebrow-00194         (extracted frames)
+
+import os
+import re
+import csv
+import logging
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+CAMERA_ID = re.compile(r'^(?:camera_)?(\d+)(?:[-_.]|$)')
+
+
+@lru_cache(maxsize=None)
+def parse_camera_id(name):
+    """ Camera number for a file or folder name, None if it does not follow a known convention. """
+    match = CAMERA_ID.match(os.path.basename(name))
+    return int(match.group(1)) if match else None
+
+
+def index_by_camera(names):
+    """ {camera_number: [names]} in input order, names without a camera number are left out. """
+    index = {}
+    for name in names:
+        camera = parse_camera_id(name)
+        if camera is not None:
+            index.setdefault(camera, []).append(name)
+    return index
+
+
+def pair_views(cal_names, max_names):
+    """ Join calibration names to modeling names on camera number.
+
+    Returns (pairs, unmatched_cal, unmatched_max); pairs are (cal_name, max_name) tuples,
+    every combination is kept when a camera has more than one name on either side.
+    """
+    max_index = index_by_camera(max_names)
+    pairs = []
+    unmatched_cal = []
+    matched_cameras = set()
+    for cal_name in cal_names:
+        camera = parse_camera_id(cal_name)
+        if camera in max_index:
+            matched_cameras.add(camera)
+            pairs.extend((cal_name, max_name) for max_name in max_index[camera])
+        else:
+            unmatched_cal.append(cal_name)
+    unmatched_max = [name for name in max_names if parse_camera_id(name) not in matched_cameras]
+    return pairs, unmatched_cal, unmatched_max
+
+
+def export_pairs(pairs, unmatched_cal, unmatched_max, output_csv):
+    """ One CSV with the pairs followed by the unmatched names of each side. """
+    with open(output_csv, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['camera', 'calibration', 'max', 'status'])
+        for cal_name, max_name in sorted(pairs, key=lambda pair: parse_camera_id(pair[0])):
+            writer.writerow([parse_camera_id(cal_name), cal_name, max_name, 'matched'])
+        for cal_name in unmatched_cal:
+            writer.writerow([parse_camera_id(cal_name), cal_name, '', 'unmatched_calibration'])
+        for max_name in unmatched_max:
+            writer.writerow([parse_camera_id(max_name), '', max_name, 'unmatched_max'])
+
+
+def list_images(folder, ext='.png'):
+    return sorted(f for f in os.listdir(folder) if f.endswith(ext))
+
+
+def pair_shoot(cal_src, shoot_root, output_dir, ext='.png'):
+    """ Pair the calibration stills against every folder of frames under shoot_root, one CSV per folder.
+
+    Returns {folder: (pairs, unmatched_cal, unmatched_max)}.
+    """
+    cal_names = list_images(cal_src, ext)
+    os.makedirs(output_dir, exist_ok=True)
+    results = {}
+    for root, _, files in os.walk(shoot_root):
+        max_names = sorted(f for f in files if f.endswith(ext))
+        if not max_names:
+            continue
+        pairs, unmatched_cal, unmatched_max = pair_views(cal_names, max_names)
+        name = os.path.relpath(root, shoot_root).replace(os.sep, '_')
+        export_pairs(pairs, unmatched_cal, unmatched_max, os.path.join(output_dir, f'{name}_pairs.csv'))
+        logger.info(f'{root}: {len(pairs)} pairs, {len(unmatched_cal)} calibration and {len(unmatched_max)} frames unmatched')
+        results[root] = (pairs, unmatched_cal, unmatched_max)
+    return results
+
+
+if __name__ == '__main__':
+    import argparse
+    from log_setup import get_logger
+    get_logger()
+    parser = argparse.ArgumentParser(description='Pair calibration stills with modeling frames by camera number.')
+    parser.add_argument('cal_src', type=str, help='Folder of calibration stills')
+    parser.add_argument('shoot_root', type=str, help='Folder (searched recursively) of modeling frames')
+    parser.add_argument('output_dir', type=str, help='Folder for the <pose>_pairs.csv files')
+    parser.add_argument('--ext', type=str, default='.png', help='Image extension to pair')
+    args = parser.parse_args()
+    pair_shoot(args.cal_src, args.shoot_root, args.output_dir, args.ext)
@@ -0,0 +1,29 @@
+# Per-camera frame renumbering table, shared by frame_number_correction (renames existing
+# frames) and pose_extract (maps corrected frame indices back to clip frames).
+# Kept free of heavy imports so reading the table does not load pandas or cv2.
+
+CAMERA_UPDATE_TABLE = {12: ((91, 194), (92, 195)),  # ((old range, new range), (old range, new range))
+                       18: ((177, 194), (178, 195)),
+                       19: ((23, 194), (24, 195)),
+                       30: ((141,192), (144, 195)),
+                       38: ((91,194), (92, 195)),
+                       40: ((10, 151), (21, 162)),
+                       41: ((89, 192), (92, 195)),
+                       45: ((99, 148), (115, 164), (149, 166), (178, 195)),
+                       50: ((15, 189), (21, 195)),
+                       55: ((132, 183), (144, 195)),
+                       59: ((12, 186), (21, 195)),
+                       64: ((91), (92), (144, 188), (151, 195)),
+                       65: ((3, 19), (7, 23)),
+                       70: ((28, 188), (35, 195)),
+                       74: ((14, 188), (21, 195)),
+                       83: ((147, 191), (151, 195)),
+                       85: ((7, 138), (35, 166), (139, 156), (178, 195)),
+                       89: ((28, 188), (35, 195))
+                       }
+
+
+def pair_ranges(range_entry):
+    # entries alternate old range, new range; a bare int is a single frame
+    ranges = [(r, r) if isinstance(r, int) else tuple(r) for r in range_entry]
+    return list(zip(ranges[0::2], ranges[1::2]))
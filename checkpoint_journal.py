@@ -0,0 +1,114 @@
+# Per-video checkpoint journal for resumable extraction.
+# The journal records every completed frame with its byte size and SHA-1, and is saved
+# atomically (temp file + fsync + rename), so a restarted job knows exactly which frames
+# are done without stat-ing the output folder, and can seek straight to the first gap.
+
+import os
+import json
+import time
+import hashlib
+import logging
+from fs_utils import atomic_write_bytes, fsync_file
+from avif_header import read_avif_header
+
+logger = logging.getLogger(__name__)
+
+# smallest frame adopted from before journaling, the size below which clean_partials calls a frame partial
+ADOPT_MIN_SIZE = 22000
+
+
+def file_sha1(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class CheckpointJournal:
+    """ Completed frames of one source video, stored as .<basename>.checkpoint.json in output_dir. """
+
+    def __init__(self, output_dir, basename, source=None, save_interval=30.0):
+        self.path = os.path.join(output_dir, f'.{basename}.checkpoint.json')
+        self.save_interval = save_interval
+        self.last_save = time.time()
+        self.frames = {}
+        self.frame_count = None
+        self.source = source
+        self.is_new = not os.path.exists(self.path)
+        if not self.is_new:
+            with open(self.path) as f:
+                data = json.load(f)
+            self.frames = {int(frame): tuple(entry) for frame, entry in data['frames'].items()}
+            self.frame_count = data.get('frame_count')
+            self.source = data.get('source', source)
+
+    def add(self, frame_num, path, sha1=None):
+        """ Record a finished frame; the journal is saved at most every save_interval seconds.
+
+        Frames finished after the last save are simply extracted again after a crash.
+        """
+        self.frames[frame_num] = (os.path.getsize(path), sha1 or file_sha1(path))
+        if time.time() - self.last_save >= self.save_interval:
+            self.save()
+
+    def adopt(self, frame_paths, min_size=ADOPT_MIN_SIZE):
+        """ Record {frame_num: path} outputs written before the journal existed.
+
+        Those frames were not staged, so a crash may have left them truncated: only complete
+        AVIFs of at least min_size bytes are adopted, the rest are deleted and extracted again.
+        """
+        adopted = 0
+        for frame_num, path in frame_paths.items():
+            try:
+                if os.path.getsize(path) < min_size:
+                    raise ValueError(f'only {os.path.getsize(path)} bytes')
+                read_avif_header(path)
+            except (OSError, ValueError) as e:
+                logger.warning(f'Not adopting {path}, it will be extracted again: {e}')
+                if os.path.exists(path):
+                    os.remove(path)
+                continue
+            self.frames[frame_num] = (os.path.getsize(path), file_sha1(path))
+            adopted += 1
+        if adopted:
+            logger.info(f'Adopted {adopted} existing frames into {self.path}')
+            self.save()
+
+    def finish(self, frame_count):
+        """ Mark the source as fully read, frame_count frames long. """
+        self.frame_count = frame_count
+        self.save()
+
+    def save(self):
+        data = {
+            'source': self.source,
+            'frame_count': self.frame_count,
+            'frames': {str(frame): list(entry) for frame, entry in sorted(self.frames.items())},
+        }
+        atomic_write_bytes(self.path, json.dumps(data).encode(), fsync=True)
+        fsync_file(os.path.dirname(self.path))
+        self.last_save = time.time()
+
+    def is_complete(self, frame_num):
+        return frame_num in self.frames
+
+    def first_incomplete(self):
+        frame_num = 0
+        while frame_num in self.frames:
+            frame_num += 1
+        return frame_num
+
+    def missing_ranges(self):
+        """ (start, end) frame ranges still to extract; end is None for the open tail of an unfinished source. """
+        ranges = []
+        start = 0
+        for frame_num in sorted(self.frames):
+            if frame_num > start:
+                ranges.append((start, frame_num - 1))
+            start = max(start, frame_num + 1)
+        if self.frame_count is None:
+            ranges.append((start, None))
+        elif start < self.frame_count:
+            ranges.append((start, self.frame_count - 1))
+        return ranges
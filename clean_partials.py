@@ -1,32 +1,41 @@
 # go through all files recursively from a given folder, check their size, and if they are smaller than a given threshold, delete them
+# only needed for frames written before the checkpoint journal: journaled extractors stage
+# each frame and rename it into place once complete, so they never leave partial files
 
 import os
 import sys
-import logging
+from log_setup import get_logger
+from frame_index import get_index
 
-logger = logging.getLogger(__name__)
-logger.addHandler(logging.FileHandler('cleanup.log'))
-logger.addHandler(logging.StreamHandler(sys.stdout))
-logging.basicConfig(filename='cleanup.log', level=logging.INFO)
+logger = get_logger(__name__, 'cleanup.log')
+
+def partial_files(index, folder, threshold):
+    # candidates come from the index, but the indexed size can be stale: a frame written in
+    # place does not touch its folder's mtime, so it may have grown since it was indexed
+    for file_path in index.files(folder, '.avif', max_size=threshold):
+        try:
+            size = os.path.getsize(file_path)
+        except OSError:
+            index.forget(file_path)
+            continue
+        if size >= threshold:
+            logger.debug(f'File {file_path} is larger than threshold')
+            continue
+        yield file_path
 
 def clean_partials(folder, threshold=22000):
-    for root, dirs, files in os.walk(folder):
-        for file in files:
-            file_path = os.path.join(root, file)
-            if os.path.getsize(file_path) < threshold and file_path.endswith('.avif'):
-                logger.info(f'Deleting {file_path}')
-                os.remove(file_path)
-            else:
-                logger.debug(f'File {file_path} is larger than threshold')
+    index = get_index()
+    index.scan(folder)
+    for file_path in partial_files(index, folder, threshold):
+        logger.info(f'Deleting {file_path}')
+        os.remove(file_path)
+        index.forget(file_path)
 
 def report_partials(folder, threshold=22000):
-    for root, dirs, files in os.walk(folder):
-        for file in files:
-            file_path = os.path.join(root, file)
-            if os.path.getsize(file_path) < threshold and file_path.endswith('.avif'):
-                logger.info(f'Found partial file: {file_path}')
-            else:
-                logger.debug(f'File {file_path} is larger than threshold')
+    index = get_index()
+    index.scan(folder)
+    for file_path in partial_files(index, folder, threshold):
+        logger.info(f'Found partial file: {file_path}')
 
 if __name__ == '__main__':
     # use args to determine whether to report or cleanse
@@ -1,22 +1,161 @@
 import os
+import json
+import struct
+import threading
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 
-def get_frame_count(file_path):
-    """Returns the total number of frames in a .mov file using FFmpeg."""
+# Frame counts are read from the container's sample table (moov/trak/.../stts), which is a
+# few KB at the start or end of the file, instead of remuxing every byte of the clip.
+# Results are cached per (path, size, mtime) so repeat runs return instantly.
+CACHE_FILE = os.environ.get("VID_CONVERT_FRAME_COUNTS", os.path.expanduser("~/.vid_convert/frame_counts.json"))
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def iter_boxes(f, start, end):
+    """ Yield (type, payload_start, box_end) for the ISO-BMFF boxes between start and end. """
+    pos = start
+    while pos + 8 <= end:
+        f.seek(pos)
+        header = f.read(8)
+        if len(header) < 8:
+            return
+        size, kind = struct.unpack(">I4s", header)
+        header_len = 8
+        if size == 1:
+            size = struct.unpack(">Q", f.read(8))[0]
+            header_len = 16
+        elif size == 0:
+            size = end - pos
+        if size < header_len:
+            return
+        yield kind, pos + header_len, pos + size
+        pos += size
+
+
+def find_box(f, start, end, kind):
+    for box, payload, box_end in iter_boxes(f, start, end):
+        if box == kind:
+            return payload, box_end
+    return None
+
+
+def read_stts_frame_count(file_path):
+    """ Sum the stts sample counts of the first video track, None if the header is missing or unreadable. """
+    with open(file_path, "rb") as f:
+        file_size = os.fstat(f.fileno()).st_size
+        moov = find_box(f, 0, file_size, b"moov")
+        if moov is None:
+            return None
+        for box, trak_start, trak_end in iter_boxes(f, *moov):
+            if box != b"trak":
+                continue
+            mdia = find_box(f, trak_start, trak_end, b"mdia")
+            if mdia is None:
+                continue
+            hdlr = find_box(f, *mdia, b"hdlr")
+            if hdlr is None:
+                continue
+            # version/flags (4) + pre_defined (4) + handler_type (4)
+            f.seek(hdlr[0] + 8)
+            if f.read(4) != b"vide":
+                continue
+            box_range = mdia
+            for kind in (b"minf", b"stbl", b"stts"):
+                box_range = find_box(f, *box_range, kind) if box_range else None
+            if box_range is None:
+                return None
+            f.seek(box_range[0] + 4)
+            entry_count = struct.unpack(">I", f.read(4))[0]
+            entries = f.read(entry_count * 8)
+            if len(entries) < entry_count * 8:
+                return None
+            return sum(count for count, _ in struct.iter_unpack(">II", entries))
+    return None
+
+
+def count_packets(file_path):
+    """ Fallback when the sample table is missing: count video packets with ffprobe (demux only, no decode). """
+    cmd = [
+        "ffprobe", "-v", "error", "-select_streams", "v:0", "-count_packets",
+        "-show_entries", "stream=nb_read_packets", "-of", "csv=p=0", file_path
+    ]
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    try:
+        return int(result.stdout.strip().split(",")[0])
+    except ValueError:
+        return 0
+
+
+def get_frame_rate(file_path):
+    """ Average frame rate of the first video stream as a float, None if ffprobe cannot tell. """
     cmd = [
-        "ffmpeg", "-i", file_path, "-map", "0:v:0", "-c", "copy", "-f", "null", "-"
+        "ffprobe", "-v", "error", "-select_streams", "v:0",
+        "-show_entries", "stream=avg_frame_rate", "-of", "csv=p=0", file_path
     ]
     result = subprocess.run(cmd, capture_output=True, text=True)
+    try:
+        num, _, den = result.stdout.strip().split(",")[0].partition("/")
+        return float(num) / float(den or 1)
+    except (ValueError, ZeroDivisionError):
+        return None
+
+
+def _load_cache():
+    global _cache
+    if _cache is None:
+        try:
+            with open(CACHE_FILE) as f:
+                _cache = json.load(f)
+        except (OSError, ValueError):
+            _cache = {}
+    return _cache
+
+
+def save_cache():
+    """ Write the frame count cache atomically. """
+    with _cache_lock:
+        cache = dict(_load_cache())
+    os.makedirs(os.path.dirname(CACHE_FILE), exist_ok=True)
+    tmp_file = f"{CACHE_FILE}.{os.getpid()}.tmp"
+    with open(tmp_file, "w") as f:
+        json.dump(cache, f)
+    os.replace(tmp_file, CACHE_FILE)
 
-    # Extract frame count from FFmpeg output
-    for line in result.stderr.split("\n"):
-        if "frame=" in line:
-            try:
-                return int(line.split("frame=")[1].split()[0])
-            except ValueError:
-                pass
 
-    return 0  # Return 0 if frame count could not be determined
+def get_frame_count(file_path, save=True):
+    """Returns the total number of frames in a .mov file, from the cache, the container header or packet counting."""
+    file_path = os.path.abspath(file_path)
+    st = os.stat(file_path)
+    with _cache_lock:
+        cached = _load_cache().get(file_path)
+    if cached and cached[0] == st.st_size and cached[1] == st.st_mtime:
+        return cached[2]
+
+    try:
+        frame_count = read_stts_frame_count(file_path)
+    except (OSError, struct.error):
+        frame_count = None
+    if not frame_count:
+        frame_count = count_packets(file_path)
+
+    if frame_count:
+        with _cache_lock:
+            _load_cache()[file_path] = [st.st_size, st.st_mtime, frame_count]
+        if save:
+            save_cache()
+    return frame_count
+
+
+def get_frame_counts(files, workers=8):
+    """ Frame counts for many files, probed concurrently. Returns {path: frames}. """
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        counts = list(executor.map(lambda file: get_frame_count(file, save=False), files))
+    save_cache()
+    return dict(zip(files, counts))
+
 
 def calculate_total_frames(directory):
     """Calculates the total frame count for all .mov files in the specified directory."""
@@ -24,10 +163,7 @@ def calculate_total_frames(directory):
     # recursicely find all .mov files in the directory
     mov_files = [os.path.join(root, file) for root, _, files in os.walk(directory) for file in files if file.endswith('.mov')]
     print(f"Found {len(mov_files)} .mov files to process.")
-    for file in mov_files:
-        print(f"Processing {file}")
-        frame_count = get_frame_count(file)
-
+    for file, frame_count in get_frame_counts(mov_files).items():
         if frame_count > 0:
             print(f"File: {file} | Frames: {frame_count}")
             total_frames += frame_count
@@ -36,6 +172,8 @@ def calculate_total_frames(directory):
 
     print(f"**Total Combined Frames:** {total_frames}")
 
-# Example usage: Change directory path if needed
-directory = '/mnt/data-local/LA-June/Body'
-calculate_total_frames(directory)
+if __name__ == "__main__":
+    import sys
+    # Example usage: Change directory path if needed
+    directory = sys.argv[1] if len(sys.argv) > 1 else '/mnt/data-local/LA-June/Body'
+    calculate_total_frames(directory)
@@ -1,20 +1,25 @@
 #!/bin/bash
 
 MOV_DIR="${1:-.}"  # Set directory (default: current)
-TOTAL_FRAMES=0
+JOBS="${2:-$(nproc)}"  # Files probed at once (default: one per core)
 
-for file in "$MOV_DIR"/*.mov; do
-    if [ -f "$file" ]; then
-        FRAME_COUNT=$(ffmpeg -i "$file" -map 0:v:0 -c copy -f null - 2>&1 | grep "frame=" | awk '{print $2}')
+# Read the frame count from the container header (nb_frames), only count packets when the header has none
+probe() {
+    file="$1"
+    FRAME_COUNT=$(ffprobe -v error -select_streams v:0 -show_entries stream=nb_frames -of csv=p=0 "$file")
+    if ! [[ "$FRAME_COUNT" =~ ^[0-9]+$ ]] || [ "$FRAME_COUNT" -eq 0 ]; then
+        FRAME_COUNT=$(ffprobe -v error -select_streams v:0 -count_packets -show_entries stream=nb_read_packets -of csv=p=0 "$file")
+    fi
 
-        # Ensure valid frame count before adding
-        if [[ "$FRAME_COUNT" =~ ^[0-9]+$ ]]; then
-            TOTAL_FRAMES=$((TOTAL_FRAMES + FRAME_COUNT))
-            echo "File: $file | Frames: $FRAME_COUNT"
-        else
-            echo "Error: Could not determine frame count for $file"
-        fi
+    # Ensure valid frame count before adding
+    if [[ "$FRAME_COUNT" =~ ^[0-9]+$ ]]; then
+        echo "File: $file | Frames: $FRAME_COUNT"
+    else
+        echo "Error: Could not determine frame count for $file"
     fi
-done
+}
+export -f probe
 
-echo "**Total Combined Frames:** $TOTAL_FRAMES"
+find "$MOV_DIR" -maxdepth 1 -type f -name '*.mov' -print0 \
+    | xargs -0 -r -n 1 -P "$JOBS" bash -c 'probe "$0"' \
+    | awk '{ print } / Frames: / { total += $NF } END { print "**Total Combined Frames:** " total + 0 }'
@@ -0,0 +1,97 @@
+# Managed ffmpeg subprocesses.
+# Commands are argument lists (no shell), every job gets explicit decoder, filter and
+# encoder thread counts, and the number of jobs running at once is sized so that
+# jobs x threads matches the core count. Exit codes and the tail of stderr are kept for
+# every job, and cancel() (or Ctrl-C) stops pending jobs and terminates running ones.
+
+import os
+import time
+import logging
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# lines of stderr kept per job
+STDERR_TAIL = 20
+
+
+def ffmpeg_command(input_file, output, output_args=(), input_args=(), threads=1):
+    """ ffmpeg argument list with the thread count pinned for decoding, filtering and encoding. """
+    return ['ffmpeg', '-hide_banner', '-nostdin', '-y', '-v', 'error',
+            '-threads', str(threads), *input_args, '-i', input_file,
+            '-filter_threads', str(threads), *output_args, '-threads', str(threads), output]
+
+
+class FFmpegResult:
+    """ Outcome of one job: returncode is None when the job was cancelled before it started. """
+
+    def __init__(self, name, returncode, stderr='', elapsed=0.0):
+        self.name = name
+        self.returncode = returncode
+        self.stderr = stderr
+        self.elapsed = elapsed
+
+    @property
+    def ok(self):
+        return self.returncode == 0
+
+
+class FFmpegRunner:
+    """ Runs ffmpeg argument lists max_jobs at a time, each with threads_per_job threads. """
+
+    def __init__(self, max_jobs=None, threads_per_job=4):
+        self.threads_per_job = threads_per_job
+        self.max_jobs = max_jobs or max(1, (os.cpu_count() or 1) // threads_per_job)
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+        self._processes = set()
+
+    def command(self, input_file, output, output_args=(), input_args=()):
+        return ffmpeg_command(input_file, output, output_args, input_args, self.threads_per_job)
+
+    def cancel(self):
+        """ Skip every job not yet started and terminate the running ones. """
+        self._cancelled.set()
+        with self._lock:
+            for process in self._processes:
+                process.terminate()
+
+    def run_one(self, name, cmd):
+        if self._cancelled.is_set():
+            return FFmpegResult(name, None)
+        start = time.time()
+        process = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                                   stderr=subprocess.PIPE, text=True, errors='replace')
+        with self._lock:
+            self._processes.add(process)
+        try:
+            _, stderr = process.communicate()
+        finally:
+            with self._lock:
+                self._processes.discard(process)
+        result = FFmpegResult(name, process.returncode, '\n'.join(stderr.splitlines()[-STDERR_TAIL:]), time.time() - start)
+        if result.ok:
+            logger.info(f'Finished {name} in {result.elapsed:.2f} sec')
+        elif self._cancelled.is_set():
+            logger.warning(f'Cancelled {name} after {result.elapsed:.2f} sec')
+        else:
+            logger.error(f'{name} exited with code {result.returncode} after {result.elapsed:.2f} sec:\n{result.stderr}')
+        return result
+
+    def run(self, jobs):
+        """ Run (name, cmd) jobs, returns their FFmpegResults in input order. """
+        jobs = list(jobs)
+        logger.info(f'Running {len(jobs)} ffmpeg jobs, {self.max_jobs} at a time with {self.threads_per_job} threads each')
+        with ThreadPoolExecutor(max_workers=self.max_jobs) as executor:
+            futures = [executor.submit(self.run_one, name, cmd) for name, cmd in jobs]
+            try:
+                results = [future.result() for future in futures]
+            except KeyboardInterrupt:
+                self.cancel()
+                raise
+        failed = sum(1 for result in results if result.returncode not in (0, None))
+        skipped = sum(1 for result in results if result.returncode is None)
+        logger.info(f'{len(results) - failed - skipped} ffmpeg jobs succeeded, {failed} failed, {skipped} cancelled')
+        return results
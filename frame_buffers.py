@@ -0,0 +1,86 @@
+# Fixed ring of reusable frame buffers for the decode loops.
+# VideoCapture.read(image=buf) decodes into an existing array, so with a pool of buffers
+# handed from the decoder to the rotate/encode/write stages and back, a steady-state
+# extraction allocates no frame-sized arrays at all and its memory use stays flat.
+# Buffers are allocated lazily, so a pool only grows to the number of frames in flight.
+
+import queue
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class FrameBufferPool:
+    """ At most size arrays of one frame shape; acquire() blocks while all of them are borrowed. """
+
+    def __init__(self, size, shape, dtype='uint8'):
+        self.size = size
+        self.shape = tuple(shape)
+        self.dtype = dtype
+        self.free = queue.LifoQueue()
+        self.lock = threading.Lock()
+        self.allocated = 0
+        self.owned = set()
+
+    @classmethod
+    def for_capture(cls, vidcap, size):
+        """ Pool sized for the BGR frames of an opened cv2.VideoCapture. """
+        import cv2
+        width = int(vidcap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(vidcap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        return cls(size, (height, width, 3))
+
+    def acquire(self):
+        try:
+            return self.free.get_nowait()
+        except queue.Empty:
+            pass
+        with self.lock:
+            if self.allocated < self.size:
+                import numpy as np
+                self.allocated += 1
+                buffer = np.empty(self.shape, dtype=self.dtype)
+                self.owned.add(id(buffer))
+                return buffer
+        return self.free.get()
+
+    def release(self, buffer):
+        """ Return a borrowed buffer; arrays that did not come from this pool are ignored. """
+        if buffer is not None and id(buffer) in self.owned:
+            self.free.put(buffer)
+
+    def read(self, vidcap):
+        """ vidcap.read() into a pooled buffer. Returns (success, image); release image when done with it. """
+        buffer = self.acquire()
+        success, image = vidcap.read(image=buffer)
+        if not success or image is None:
+            self.release(buffer)
+            return False, None
+        if image is not buffer:
+            # the decoder allocated its own array (frame size differs from the capture properties)
+            logger.debug(f'Decoded frame shape {image.shape} does not fit pool buffers of {self.shape}')
+            self.release(buffer)
+        return True, image
+
+
+class FrameBufferPools:
+    """ FrameBufferPools shared by concurrent decoders, one per frame shape, each of at most size buffers.
+
+    Sharing bounds the raw frames held by all decoders together: with size = writer bound +
+    number of decoders, every frame queued at the writer plus one being decoded per decoder
+    has a buffer, and nothing beyond that is ever allocated.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.pools = {}
+        self.lock = threading.Lock()
+
+    def for_capture(self, vidcap):
+        import cv2
+        shape = (int(vidcap.get(cv2.CAP_PROP_FRAME_HEIGHT)), int(vidcap.get(cv2.CAP_PROP_FRAME_WIDTH)), 3)
+        with self.lock:
+            if shape not in self.pools:
+                self.pools[shape] = FrameBufferPool(self.size, shape)
+            return self.pools[shape]
@@ -0,0 +1,80 @@
+# Near-duplicate frame detection for static stretches of long pose captures.
+# Every decoded frame is reduced to a tiny grayscale thumbnail (cv2.resize with INTER_AREA,
+# one vectorized pass) and compared with the thumbnail of the last frame that was kept.
+# Frames within the threshold are not encoded; the extractors hard-link the kept frame to
+# their names (link_duplicates), so the on-disk sequence stays complete, and record them in
+# the frame index as a reference to the kept frame (FrameIndex.record_refs / resolve).
+
+import logging
+import cv2
+import numpy as np
+from output_cache import link_or_copy
+
+logger = logging.getLogger(__name__)
+
+# thumbnail size for the 'diff' method, big enough to see a blink, small enough to be free
+THUMB_SIZE = (32, 32)
+# mean absolute difference (0-255 scale) or differing dHash bits below which a frame is a duplicate
+DEFAULT_THRESHOLDS = {'diff': 1.5, 'dhash': 2}
+
+
+def thumbnail(image, size=THUMB_SIZE):
+    """ Downsampled grayscale copy of a BGR (or already gray) frame. """
+    if image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+
+
+def dhash(image, hash_size=8):
+    """ 64-bit difference hash as a packed uint8 array: is each pixel brighter than its right neighbour. """
+    small = thumbnail(image, (hash_size + 1, hash_size))
+    return np.packbits(small[:, 1:] > small[:, :-1])
+
+
+def mean_abs_diff(a, b):
+    return float(np.mean(np.abs(a.astype(np.int16) - b.astype(np.int16))))
+
+
+def hamming(a, b):
+    return int(np.unpackbits(np.bitwise_xor(a, b)).sum())
+
+
+class FrameDeduper:
+    """ Tracks the last kept frame of one video and decides whether the next frame repeats it. """
+
+    def __init__(self, threshold=None, method='diff'):
+        if method not in DEFAULT_THRESHOLDS:
+            raise ValueError(f'Unknown dedup method: {method}')
+        self.method = method
+        self.threshold = DEFAULT_THRESHOLDS[method] if threshold is None else threshold
+        self.kept_signature = None
+        self.kept_name = None
+        self.skipped = 0
+
+    def signature(self, image):
+        return dhash(image) if self.method == 'dhash' else thumbnail(image)
+
+    def distance(self, a, b):
+        return hamming(a, b) if self.method == 'dhash' else mean_abs_diff(a, b)
+
+    def reference(self, image, name):
+        """ Name of the kept frame that image duplicates, or None after keeping image as name. """
+        signature = self.signature(image)
+        if self.kept_signature is not None and self.distance(signature, self.kept_signature) <= self.threshold:
+            self.skipped += 1
+            return self.kept_name
+        self.kept_signature = signature
+        self.kept_name = name
+        return None
+
+
+def link_duplicates(refs):
+    """ Place each kept frame at the names of its skipped duplicates, [(name, kept), ...]; returns the names placed. """
+    linked = []
+    for name, kept in refs:
+        try:
+            link_or_copy(kept, name)
+            linked.append(name)
+        except OSError as e:
+            logger.error(f'Could not link duplicate {name} to {kept}: {e}')
+    return linked
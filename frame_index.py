@@ -0,0 +1,213 @@
+# Persistent manifest of extracted frames.
+# A SQLite file records every frame with its model/pose/camera/frame number, size and mtime,
+# plus the mtime of every directory under an indexed root. Rescans only list directories
+# whose mtime changed, so looking up frames in a 100k+ file tree no longer walks the tree.
+# Frames skipped as duplicates are kept in refs as a pointer to the frame that was written.
+
+import os
+import sqlite3
+import logging
+import threading
+from frame_record import parse_frame_path
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB = os.environ.get('FRAME_INDEX_DB', os.path.expanduser('~/.vid_convert/frame_index.sqlite'))
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    dir TEXT NOT NULL,
+    model TEXT,
+    pose TEXT,
+    camera TEXT,
+    frame INTEGER,
+    ext TEXT,
+    size INTEGER,
+    mtime REAL
+);
+CREATE INDEX IF NOT EXISTS files_dir ON files(dir);
+CREATE INDEX IF NOT EXISTS files_key ON files(model, pose, camera, frame);
+CREATE TABLE IF NOT EXISTS dirs (
+    path TEXT PRIMARY KEY,
+    parent TEXT,
+    mtime REAL
+);
+CREATE INDEX IF NOT EXISTS dirs_parent ON dirs(parent);
+CREATE TABLE IF NOT EXISTS refs (
+    path TEXT PRIMARY KEY,
+    ref TEXT NOT NULL
+);
+'''
+
+def _prefix_range(root):
+    # every path under root sorts between root/ and root0 ('0' follows '/')
+    root = os.path.abspath(root).rstrip('/')
+    return root + '/', root + '0'
+
+
+class FrameIndex:
+    """ On-disk index of frame files, safe to share between threads of one process. """
+
+    def __init__(self, db_path=DEFAULT_DB):
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, timeout=60, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def _file_row(self, path, size, mtime):
+        record = parse_frame_path(path)
+        return path, os.path.dirname(path), record.model, record.pose, record.camera, record.frame, record.ext, size, mtime
+
+    def _forget_tree(self, path):
+        low, high = _prefix_range(path)
+        self.conn.execute('DELETE FROM files WHERE dir = ? OR (path >= ? AND path < ?)', (path, low, high))
+        self.conn.execute('DELETE FROM dirs WHERE path = ? OR (path >= ? AND path < ?)', (path, low, high))
+
+    def _rescan_dir(self, path, mtime):
+        files = []
+        subdirs = []
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirs.append(entry.path)
+                elif entry.is_file():
+                    st = entry.stat()
+                    files.append(self._file_row(entry.path, st.st_size, st.st_mtime))
+        self.conn.execute('DELETE FROM files WHERE dir = ?', (path,))
+        self.conn.executemany('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', files)
+        known = {row[0] for row in self.conn.execute('SELECT path FROM dirs WHERE parent = ?', (path,))}
+        for gone in known.difference(subdirs):
+            self._forget_tree(gone)
+        # new subdirectories get mtime -1 so the walk below always lists them
+        self.conn.executemany('INSERT OR IGNORE INTO dirs VALUES (?, ?, -1)', [(d, path) for d in subdirs])
+        self.conn.execute('INSERT OR REPLACE INTO dirs VALUES (?, (SELECT parent FROM dirs WHERE path = ?), ?)',
+                          (path, path, mtime))
+        return subdirs
+
+    def scan(self, root):
+        """ Bring the index for root up to date, listing only directories whose mtime changed. """
+        root = os.path.abspath(root).rstrip('/')
+        rescanned = 0
+        with self.lock, self.conn:
+            stack = [root]
+            while stack:
+                path = stack.pop()
+                try:
+                    mtime = os.stat(path).st_mtime
+                except FileNotFoundError:
+                    self._forget_tree(path)
+                    continue
+                row = self.conn.execute('SELECT mtime FROM dirs WHERE path = ?', (path,)).fetchone()
+                if row is not None and row[0] == mtime:
+                    stack.extend(r[0] for r in self.conn.execute('SELECT path FROM dirs WHERE parent = ?', (path,)))
+                else:
+                    stack.extend(self._rescan_dir(path, mtime))
+                    rescanned += 1
+        logger.debug(f'Rescanned {rescanned} directories under {root}')
+        return rescanned
+
+    def record(self, paths):
+        """ Add or refresh specific files, called by extractors as they write frames. """
+        if isinstance(paths, str):
+            paths = [paths]
+        rows = []
+        for path in paths:
+            path = os.path.abspath(path)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            rows.append(self._file_row(path, st.st_size, st.st_mtime))
+        with self.lock, self.conn:
+            self.conn.executemany('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+
+    def forget(self, paths):
+        """ Drop files that were deleted or renamed. """
+        if isinstance(paths, str):
+            paths = [paths]
+        with self.lock, self.conn:
+            self.conn.executemany('DELETE FROM files WHERE path = ?', [(os.path.abspath(p),) for p in paths])
+
+    def record_refs(self, pairs):
+        """ Record (path, ref) pairs for frames that were not written because they duplicate ref. """
+        rows = [(os.path.abspath(path), os.path.abspath(ref)) for path, ref in pairs]
+        with self.lock, self.conn:
+            self.conn.executemany('INSERT OR REPLACE INTO refs VALUES (?, ?)', rows)
+
+    def resolve(self, path):
+        """ The file that holds the pixels of path: its ref if it was deduplicated, else path itself. """
+        path = os.path.abspath(path)
+        with self.lock:
+            row = self.conn.execute('SELECT ref FROM refs WHERE path = ?', (path,)).fetchone()
+        return row[0] if row else path
+
+    def refs(self, root):
+        """ {path: ref} for the deduplicated frames under root. """
+        low, high = _prefix_range(root)
+        with self.lock:
+            return dict(self.conn.execute('SELECT path, ref FROM refs WHERE path >= ? AND path < ?', (low, high)))
+
+    def files(self, root, ext=None, max_size=None):
+        """ Paths of indexed files under root, optionally filtered by extension and size. """
+        low, high = _prefix_range(root)
+        query = 'SELECT path FROM files WHERE path >= ? AND path < ?'
+        args = [low, high]
+        if ext is not None:
+            query += ' AND ext = ?'
+            args.append(ext)
+        if max_size is not None:
+            query += ' AND size < ?'
+            args.append(max_size)
+        with self.lock:
+            return [row[0] for row in self.conn.execute(query + ' ORDER BY path', args)]
+
+    def lookup(self, root=None, model=None, pose=None, camera=None, frame=None, ext=None):
+        """ Paths matching the given model/pose/camera/frame keys, optionally limited to root. """
+        query = 'SELECT path FROM files WHERE 1'
+        args = []
+        if root is not None:
+            query += ' AND path >= ? AND path < ?'
+            args.extend(_prefix_range(root))
+        for column, value in (('model', model), ('pose', pose), ('camera', camera), ('frame', frame), ('ext', ext)):
+            if value is not None:
+                query += f' AND {column} = ?'
+                args.append(value)
+        with self.lock:
+            return [row[0] for row in self.conn.execute(query + ' ORDER BY path', args)]
+
+
+_indexes = {}
+
+
+def get_index(db_path=DEFAULT_DB):
+    """ One FrameIndex per process and database, sqlite connections must not cross a fork. """
+    key = (os.getpid(), db_path)
+    if key not in _indexes:
+        _indexes[key] = FrameIndex(db_path)
+    return _indexes[key]
+
+
+def list_files(folder, ext):
+    """ Incrementally rescan folder, then return every file under it with the given extension. """
+    index = get_index()
+    index.scan(folder)
+    return index.files(folder, ext)
+
+
+if __name__ == '__main__':
+    import sys
+    logging.basicConfig(level=logging.INFO)
+    if len(sys.argv) < 2:
+        logger.error('Please provide one or more folders to index')
+        sys.exit(1)
+    for folder in sys.argv[1:]:
+        count = get_index().scan(folder)
+        logger.info(f'{folder}: rescanned {count} directories, {len(get_index().files(folder))} files indexed')
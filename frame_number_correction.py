@@ -3,10 +3,16 @@
 
 import os
 import sys
-import logging
+from log_setup import get_logger
+import json
+import numpy as np
 import pandas as pd
 from datetime import datetime
 from process_mp4 import convert_png_to_avif, get_all_pngs, get_all_avifs, pad_frame_number
+from frame_index import get_index
+from frame_record import parse_frame_path
+from camera_updates import CAMERA_UPDATE_TABLE, pair_ranges
+from fs_utils import fsync_file
 from PIL import Image
 import pillow_avif
 from pathlib import Path
@@ -15,53 +21,25 @@ import time
 
 
 # Set up logging
-logging.basicConfig(filename='frame_number_correction.log', level=logging.INFO)
-logger = logging.getLogger(__name__)
-logger.addHandler(logging.FileHandler('frame_number_correction.log'))
-logger.addHandler(logging.StreamHandler(sys.stdout))
+logger = get_logger(__name__, 'frame_number_correction.log')
 
 L_ROOT = '/Users/spooky/Downloads/LA-data-frames'
 R_ROOT = '/mnt/data/datasets/LA-data-frames'
 
-CAMERA_UPDATE_TABLE = {12: ((91, 194), (92, 195)),  # ((old range, new range), (old range, new range))
-                       18: ((177, 194), (178, 195)),
-                       19: ((23, 194), (24, 195)),
-                       30: ((141,192), (144, 195)),
-                       38: ((91,194), (92, 195)),
-                       40: ((10, 151), (21, 162)),
-                       41: ((89, 192), (92, 195)),
-                       45: ((99, 148), (115-164), (149, 166), (178, 195)),
-                       50: ((15, 189), (21, 195)),
-                       55: ((132, 183), (144, 195)),
-                       59: ((12, 186), (21, 195)),
-                       64: ((91), (92), (144, 188), (151, 195)),
-                       65: ((3, 19), (7, 23)),
-                       70: ((28, 188), (35, 195)),
-                       74: ((14, 188), (21, 195)),
-                       83: ((147, 191), (151, 195)),
-                       85: ((7, 138), (35, 166), (139, 156), (178, 195)),
-                       89: ((28, 188), (35, 195))
-                       }
 
 def get_camera_number_from_path(avif_path):
     # Extract the camera number from the avif path, filenames are similar to this camera_02-EXP_eyebrow-00194.avif
-    base = os.path.basename(avif_path)
-    camera_number = base.split('-')[0].split('_')[1]
-    try:
-        return int(camera_number)
-    except BaseException as e:
-        logger.error(f'Error extracting camera number from {base}: {e}')
-        return None
+    camera_number = parse_frame_path(avif_path).camera_number
+    if camera_number is None:
+        logger.error(f'Error extracting camera number from {os.path.basename(avif_path)}')
+    return camera_number
 
 def get_frame_number_from_path(avif_path):
     # Extract the frame number from the avif_path filenames look like camera_02-EXP_eyebrow-00194.avif
-    base = os.path.basename(avif_path)
-    frame_number = base.split('-')[-1].split('.')[0]
-    try:
-        return int(frame_number)
-    except BaseException as e:
-        logger.error(f'Error extracting frame number from {base}: {e}')
-        return None
+    frame_number = parse_frame_path(avif_path).frame
+    if frame_number is None:
+        logger.error(f'Error extracting frame number from {os.path.basename(avif_path)}')
+    return frame_number
 
 def get_range_entry(camera_number):
     # Get the range entry for the given camera number
@@ -74,85 +52,178 @@ def get_range_entry(camera_number):
 def frame_in_range(frame_number, range_entry):
     # Check if the frame number is in the given range entry
     try:
-        for old_range, new_range in range_entry:
+        for old_range, new_range in pair_ranges(range_entry):
             if old_range[0] <= frame_number <= old_range[1]:
                 return True
     except:
         pass
     return False
 
-# def names_from_ranges(range_entry, old_filename):
-#     camera_number = pad_frame_number(get_camera_number_from_path(old_filename), 2)
-#     frame_number = pad_frame_number(get_frame_number_from_path(old_filename), 5)
-#     base_name = os.path.basename(old_filename)
-#     print(f'Base name: {base_name} Frame number: {frame_number} Camera number: {camera_number}')
-#     # common case, old range is a 2 value tuple, new range is a 2 value tuple
-#     if len(range_entry) == 2:
-#         print(f'Range entry: {range_entry}')
-#         old_range = range_entry[0]
-#         new_range = range_entry[1]
-#         offset = new_range - old_range
-#
-#         # if the frame_number is within the old range, calculate the new frame number
-#         if old_range[0] >= frame_number <= old_range[1]:
-#             new_frame_number = frame_number + offset
-#             new_frame_padded = pad_frame_number(new_frame_number)
-#             old_frame_padded = pad_frame_number(frame_number)
-#             new_frame_name = old_filename.replace(old_frame_padded, new_frame_padded)
-#             return new_frame_name
-#     return f'Base name: {base_name} Frame number: {frame_number} Camera number: {camera_number}'
 
-
-if __name__ == '__main__':
-    gather = {}
-    if os.path.exists(L_ROOT):
-        ALL_FRAMES = get_all_avifs(L_ROOT)
+# Renumbering engine
+# The whole file list is loaded into one table (path, camera, frame), the new frame numbers
+# for every camera are computed in a single merge against the range table, collisions are
+# rejected up front, and renames run in dependency order with a write-ahead undo journal.
+
+def range_table(camera_table=CAMERA_UPDATE_TABLE):
+    """ One row per (camera, old_start, old_end, offset) segment of the update table. """
+    rows = []
+    for camera, entry in camera_table.items():
+        for old_range, new_range in pair_ranges(entry):
+            if old_range[1] - old_range[0] != new_range[1] - new_range[0]:
+                logger.warning(f'Camera {camera}: old range {old_range} and new range {new_range} differ in length')
+            rows.append((camera, old_range[0], old_range[1], new_range[0] - old_range[0]))
+    return pd.DataFrame(rows, columns=['camera', 'old_start', 'old_end', 'offset'])
+
+
+def load_frame_table(paths):
+    """ Columnar (path, prefix, frame, width, ext, camera) table for a list of frame paths. """
+    # camera_02-EXP_eyebrow-00194.avif names carry the camera, camera_07/EXP-00003.avif folders do otherwise
+    records = [parse_frame_path(path) for path in paths]
+    frames = pd.DataFrame({
+        'path': pd.Series([r.path for r in records], dtype=object),
+        'prefix': pd.Series([r.prefix for r in records], dtype=object),
+        'frame': pd.Series([r.frame for r in records], dtype=float),
+        'width': pd.Series([r.width for r in records], dtype=float),
+        'ext': pd.Series([r.ext for r in records], dtype=object),
+        'camera': pd.Series([r.camera_number for r in records], dtype=float),
+    })
+    unparsed = frames['frame'].isna() | frames['camera'].isna()
+    if unparsed.any():
+        logger.warning(f'Skipping {int(unparsed.sum())} files whose camera or frame could not be parsed')
+    frames = frames[~unparsed].copy()
+    frames['frame'] = frames['frame'].astype(np.int64)
+    frames['camera'] = frames['camera'].astype(np.int64)
+    frames['width'] = frames['width'].astype(np.int64)
+    return frames
+
+
+def plan_renames(frames, ranges):
+    """ Rename plan (path, new_path, camera, frame, new_frame) plus a list of problems that block it. """
+    moves = frames.merge(ranges, on='camera')
+    moves = moves[(moves['frame'] >= moves['old_start']) & (moves['frame'] <= moves['old_end'])].copy()
+    moves['new_frame'] = moves['frame'] + moves['offset']
+    new_number = pd.Series(index=moves.index, dtype=object)
+    for width, group in moves.groupby('width'):
+        new_number[group.index] = group['new_frame'].astype(str).str.zfill(width)
+    moves['new_path'] = moves['prefix'] + new_number + moves['ext']
+    moves = moves[moves['new_path'] != moves['path']]
+
+    problems = []
+    overlapping = moves['path'].duplicated(keep=False)
+    for path in moves.loc[overlapping, 'path'].unique():
+        problems.append(f'{path} falls in more than one range')
+    duplicate_targets = moves['new_path'].duplicated(keep=False)
+    for path in moves.loc[duplicate_targets, 'new_path'].unique():
+        problems.append(f'{path} is the target of more than one rename')
+    # a target may only exist on disk if that file is itself being moved out of the way
+    occupied = moves['new_path'].isin(frames['path']) & ~moves['new_path'].isin(moves['path'])
+    for src, dst in moves.loc[occupied, ['path', 'new_path']].itertuples(index=False):
+        problems.append(f'{src} -> {dst} would overwrite a file that is not being renamed')
+    columns = ['path', 'new_path', 'camera', 'frame', 'new_frame']
+    return moves[columns].sort_values(['camera', 'path']).reset_index(drop=True), problems
+
+
+def order_renames(pairs):
+    """ Order (src, dst) renames so no target is overwritten, breaking cycles with a temp name. """
+    pending = dict(pairs)
+    # waiting[d] = s: the move s -> d has to wait until d itself has been moved
+    waiting = {dst: src for src, dst in pending.items() if dst in pending}
+    ready = [src for src, dst in pending.items() if dst not in pending]
+    ordered = []
+    while ready:
+        src = ready.pop()
+        ordered.append((src, pending.pop(src)))
+        if src in waiting:
+            ready.append(waiting.pop(src))
+    # whatever is left forms cycles, e.g. a -> b -> a
+    while pending:
+        start = next(iter(pending))
+        cycle = [start]
+        while pending[cycle[-1]] != start:
+            cycle.append(pending[cycle[-1]])
+        tmp = f'{start}.renumber.tmp'
+        ordered.append((start, tmp))
+        for src in reversed(cycle[1:]):
+            ordered.append((src, pending[src]))
+        ordered.append((tmp, pending[start]))
+        for src in cycle:
+            del pending[src]
+    return ordered
+
+
+def apply_renames(ordered, journal_path):
+    """ Rename in order, writing each step to the journal (and fsyncing it) before it happens. """
+    index = get_index()
+    done = []
+    with open(journal_path, 'a') as journal:
+        for src, dst in ordered:
+            journal.write(json.dumps({'src': src, 'dst': dst}) + '\n')
+            journal.flush()
+            os.fsync(journal.fileno())
+            os.rename(src, dst)
+            done.append((src, dst))
+    fsync_file(os.path.dirname(os.path.abspath(journal_path)))
+    index.forget([src for src, _ in done])
+    index.record([dst for _, dst in done])
+    logger.info(f'Applied {len(done)} renames, undo journal: {journal_path}')
+    return done
+
+
+def undo_renames(journal_path):
+    """ Reverse a journal, newest step first. Steps that never happened are skipped. """
+    with open(journal_path) as journal:
+        steps = [json.loads(line) for line in journal if line.strip()]
+    undone = []
+    for step in reversed(steps):
+        if os.path.exists(step['dst']) and not os.path.exists(step['src']):
+            os.rename(step['dst'], step['src'])
+            undone.append((step['dst'], step['src']))
+    index = get_index()
+    index.forget([src for src, _ in undone])
+    index.record([dst for _, dst in undone])
+    logger.info(f'Undid {len(undone)} of {len(steps)} journaled renames')
+    return undone
+
+
+def renumber_frames(root, apply=False, plan_csv=None, journal_path=None):
+    """ Plan (and optionally apply) the CAMERA_UPDATE_TABLE renumbering for every AVIF under root. """
+    start = time.time()
+    frames = load_frame_table(get_all_avifs(root))
+    moves, problems = plan_renames(frames, range_table())
+    ordered = order_renames(zip(moves['path'], moves['new_path']))
+    logger.info(f'{len(frames)} frames loaded, {len(moves)} renames planned across '
+                f'{moves["camera"].nunique()} cameras in {time.time() - start:.2f} sec')
+    for camera, count in moves.groupby('camera').size().items():
+        logger.info(f'Camera {camera}: {count} frames to renumber')
+    if plan_csv:
+        moves.to_csv(plan_csv, index=False)
+        logger.info(f'Plan written to {plan_csv}')
+    if problems:
+        for problem in problems:
+            logger.error(problem)
+        logger.error(f'{len(problems)} problems found, nothing renamed')
+        return moves, problems
+    if apply:
+        journal_path = journal_path or f'renumber-{datetime.now().strftime("%Y%m%d-%H%M%S")}.journal'
+        apply_renames(ordered, journal_path)
     else:
-        ALL_FRAMES = get_all_avifs(R_ROOT)
-
-    if ALL_FRAMES:
-        for frame in ALL_FRAMES:
-            camera_number = get_camera_number_from_path(frame)
-            frame_number = get_frame_number_from_path(frame)
-            base_name = os.path.basename(frame)
-            if camera_number in CAMERA_UPDATE_TABLE.keys():
-               if camera_number not in gather.keys():
-                   gather[camera_number] = []
-               if frame_in_range(frame_number, CAMERA_UPDATE_TABLE[camera_number]):
-                   gather[camera_number].append(base_name)
-
-    for camera_number, frames in gather.items():
-        logger.info(f'Camera number: {camera_number}')
-        for frame in frames:
-            logger.info(f'Frame: {frame}')
-
-'''
-Error extracting camera number from camera_02-EXP_eyebrow-00194.avif: invalid literal for int() with base 10: '02-EXP'
-Error extracting frame number from camera_02-EXP_eyebrow-00194.avif: invalid literal for int() with base 10: 'EXP_eyebrow'
-Error extracting camera number from camera_34-EXP_eyebrow-00648.avif: invalid literal for int() with base 10: '34-EXP'
-Error extracting frame number from camera_34-EXP_eyebrow-00648.avif: invalid literal for int() with base 10: 'EXP_eyebrow'
-Error extracting camera number from camera_41-EXP_eyebrow-00227.avif: invalid literal for int() with base 10: '41-EXP'
-Error extracting frame number from camera_41-EXP_eyebrow-00227.avif: invalid literal for int() with base 10: 'EXP_eyebrow'
-'''
-
-
-    #     logger.info(f'Found {len(ALL_FRAMES)} frames to process')
-    #     for frame in ALL_FRAMES:
-    #         camera_number = get_camera_number_from_path(frame)
-    #         frame_number = get_frame_number_from_path(frame)
-    #         print(f'Processing frame {frame_number}, camera {camera_number}')
-    #         try:
-    #             names = names_from_ranges(camera_number, frame)
-    #             if names:
-    #                 print(names)
-    #                 logger.info(f'Proposed: {frame} to {names}')
-    #                 # os.rename(frame, names)
-    #                 if os.path.exists(names):
-    #                     logger.info(f'Frame {names} exists!')
-    #         except:
-    #             pass
-    # else:
-    #     logger.warning('No frames found to process')
-    #     sys.exit(1)
+        logger.info('Dry run, pass --apply to rename')
+    return moves, problems
 
 
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Renumber frames using CAMERA_UPDATE_TABLE.')
+    parser.add_argument('root', nargs='?', default=None, help='Frames root (default: L_ROOT if present, else R_ROOT)')
+    parser.add_argument('--apply', action='store_true', help='Perform the renames (default is a dry run)')
+    parser.add_argument('--plan', type=str, default=None, help='Write the rename plan to this CSV')
+    parser.add_argument('--journal', type=str, default=None, help='Undo journal path used by --apply')
+    parser.add_argument('--undo', type=str, default=None, help='Reverse the renames recorded in this journal')
+    args = parser.parse_args()
+    if args.undo:
+        undo_renames(args.undo)
+        sys.exit(0)
+    root = args.root or (L_ROOT if os.path.exists(L_ROOT) else R_ROOT)
+    _, problems = renumber_frames(root, args.apply, args.plan, args.journal)
+    sys.exit(1 if problems else 0)
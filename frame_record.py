@@ -0,0 +1,78 @@
+# One parser for model/pose/camera/frame paths, shared by every tool.
+# A single compiled regex reads the whole path and the result is a small __slots__ record,
+# cached per path, so scanning 100k+ paths neither re-splits strings in every tool nor
+# allocates a dict per file. Supported layouts:
+#   Model1/EXP_eye_neutral/camera_07-0003.mp4                 (source clips)
+#   Model1/EXP_eye_neutral/camera_07/EXP_eye_neutral-00003.avif (extracted frames)
+#   Model1/EXP_eyebrow/camera_02-EXP_eyebrow-00194.avif        (renamed frames)
+#   modeling/camera_07_EXP_eye_neutral-00003.png              (modeling sets)
+
+import os
+import re
+from functools import lru_cache
+
+FRAME_PATH = re.compile(r'''
+    ^(?:(?:(?:.*/)?(?P<model>(?!camera_\d+/)[^/]+)/)?(?P<pose>(?!camera_\d+/)[^/]+)/)?
+    (?:(?P<dir_camera>camera_\d+)/)?
+    (?:
+        (?:(?P<name_camera>camera_\d+)[-_])?
+        (?:(?P<stem>[^/]*?)[-_])?
+        (?P<frame>\d+)(?P<ext>\.\w+)
+    |[^/]*)$
+''', re.VERBOSE)
+
+
+class FrameRecord:
+    """ Parsed path; parts that the path does not carry are None.
+
+    camera is the 'camera_07' label, taken from the file name or its camera folder,
+    stem is what precedes the frame number in the name (usually the pose), width is the
+    number of digits of the frame number as written.
+    """
+
+    __slots__ = ('path', 'model', 'pose', 'camera', 'stem', 'frame', 'width', 'ext')
+
+    def __init__(self, path, model=None, pose=None, camera=None, stem=None, frame=None, width=None, ext=None):
+        self.path = path
+        self.model = model
+        self.pose = pose
+        self.camera = camera
+        self.stem = stem
+        self.frame = frame
+        self.width = width
+        self.ext = ext
+
+    @property
+    def camera_number(self):
+        return int(self.camera[7:]) if self.camera else None
+
+    @property
+    def prefix(self):
+        """ path up to the frame number, for building renumbered names. """
+        if self.frame is None:
+            return None
+        return self.path[:len(self.path) - self.width - len(self.ext)]
+
+    def __repr__(self):
+        return (f'FrameRecord({self.path!r}, model={self.model!r}, pose={self.pose!r}, camera={self.camera!r}, '
+                f'stem={self.stem!r}, frame={self.frame!r}, ext={self.ext!r})')
+
+
+@lru_cache(maxsize=1 << 18)
+def parse_frame_path(path):
+    """ FrameRecord for a clip or frame path, cached per path. """
+    # a leading / would leave nothing for the pose of /pose/frame.avif to match
+    match = FRAME_PATH.match(path.lstrip('/'))
+    if match is None:
+        return FrameRecord(path, ext=os.path.splitext(path)[1])
+    frame = match.group('frame')
+    return FrameRecord(
+        path,
+        model=match.group('model'),
+        pose=match.group('pose'),
+        camera=match.group('name_camera') or match.group('dir_camera'),
+        stem=match.group('stem'),
+        frame=int(frame) if frame is not None else None,
+        width=len(frame) if frame is not None else None,
+        ext=match.group('ext') or os.path.splitext(path)[1],
+    )
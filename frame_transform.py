@@ -0,0 +1,137 @@
+# Rotation stage shared by the extractors.
+# Pixel rotation writes the transposed frame into a buffer that is reused for every frame of
+# the same shape (one per thread), instead of allocating a new 4K array per cv2.rotate call.
+# PNG outputs can instead keep their pixels and carry an EXIF orientation in an eXIf chunk,
+# which rotate_pngs inserts into existing files without decoding or re-encoding them.
+
+import os
+import zlib
+import struct
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from fs_utils import atomic_write_bytes
+
+logger = logging.getLogger(__name__)
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+# clockwise degrees <-> EXIF orientation (rotations only, no mirroring)
+ORIENTATIONS = {0: 1, 90: 6, 180: 3, 270: 8}
+CLOCKWISE = {orientation: degrees for degrees, orientation in ORIENTATIONS.items()}
+
+_local = threading.local()
+
+
+class Rotator:
+    """ Rotates frames clockwise into one preallocated buffer.
+
+    The returned array is overwritten by the next call, so it has to be consumed (encoded,
+    copied) first.
+    """
+
+    def __init__(self, degrees=90):
+        import cv2
+        if degrees % 360 not in ORIENTATIONS:
+            raise ValueError(f'Only multiples of 90 degrees are supported, got {degrees}')
+        self.degrees = degrees % 360
+        self.code = {90: cv2.ROTATE_90_CLOCKWISE, 180: cv2.ROTATE_180, 270: cv2.ROTATE_90_COUNTERCLOCKWISE}.get(self.degrees)
+        self.buffer = None
+
+    def __call__(self, image):
+        import cv2
+        if self.code is None:
+            return image
+        shape = image.shape if self.degrees == 180 else (image.shape[1], image.shape[0]) + image.shape[2:]
+        if self.buffer is None or self.buffer.shape != shape or self.buffer.dtype != image.dtype:
+            import numpy as np
+            self.buffer = np.empty(shape, dtype=image.dtype)
+        return cv2.rotate(image, self.code, dst=self.buffer)
+
+
+def rotate(image, degrees=90):
+    """ Rotate clockwise with this thread's Rotator; the result is only valid until the thread's next call. """
+    rotators = getattr(_local, 'rotators', None)
+    if rotators is None:
+        rotators = _local.rotators = {}
+    if degrees not in rotators:
+        rotators[degrees] = Rotator(degrees)
+    return rotators[degrees](image)
+
+
+def exif_orientation(orientation):
+    """ Minimal big-endian EXIF (TIFF) block holding only the Orientation tag. """
+    entry = struct.pack('>HHIHH', 0x0112, 3, 1, orientation, 0)
+    return b'MM\x00\x2a' + struct.pack('>I', 8) + struct.pack('>H', 1) + entry + struct.pack('>I', 0)
+
+
+def iter_png_chunks(data):
+    """ Yield (type, start, end) of every chunk, start/end covering length, type, payload and CRC. """
+    if not data.startswith(PNG_SIGNATURE):
+        raise ValueError('Not a PNG file')
+    pos = len(PNG_SIGNATURE)
+    while pos + 8 <= len(data):
+        length, kind = struct.unpack('>I4s', data[pos:pos + 8])
+        end = pos + 12 + length
+        yield kind, pos, end
+        pos = end
+
+
+def png_orientation(data):
+    """ EXIF orientation stored in a PNG's eXIf chunk, 1 when there is none. """
+    for kind, start, end in iter_png_chunks(data):
+        if kind == b'eXIf':
+            exif = data[start + 8:end - 4]
+            fmt = '>' if exif[:2] == b'MM' else '<'
+            ifd = struct.unpack(fmt + 'I', exif[4:8])[0]
+            count = struct.unpack(fmt + 'H', exif[ifd:ifd + 2])[0]
+            for i in range(count):
+                tag, _, _, value = struct.unpack(fmt + 'HHIH', exif[ifd + 2 + i * 12:ifd + 12 + i * 12])
+                if tag == 0x0112:
+                    return value
+        if kind == b'IDAT':
+            break
+    return 1
+
+
+def set_png_orientation(data, orientation):
+    """ PNG bytes with their eXIf chunk replaced by one holding only orientation; pixel data is copied as is. """
+    payload = exif_orientation(orientation)
+    chunk = struct.pack('>I', len(payload)) + b'eXIf' + payload + struct.pack('>I', zlib.crc32(b'eXIf' + payload))
+    parts = [PNG_SIGNATURE]
+    inserted = False
+    for kind, start, end in iter_png_chunks(data):
+        if kind == b'eXIf':
+            continue
+        if kind == b'IDAT' and not inserted:
+            # eXIf has to come before the image data
+            parts.append(chunk)
+            inserted = True
+        parts.append(data[start:end])
+    return b''.join(parts)
+
+
+def orient_png(src, dst, degrees):
+    """ Copy src to dst with degrees more clockwise rotation in its EXIF orientation, returns dst. """
+    with open(src, 'rb') as f:
+        data = f.read()
+    current = CLOCKWISE.get(png_orientation(data), 0)
+    atomic_write_bytes(dst, set_png_orientation(data, ORIENTATIONS[(current + degrees) % 360]))
+    return dst
+
+
+def rotate_pngs(files, output_folder, degrees, workers=None):
+    """ Rotate many PNGs by metadata only, in parallel. Returns the files written. """
+    if degrees % 360 not in ORIENTATIONS:
+        raise ValueError(f'Only multiples of 90 degrees are supported, got {degrees}')
+    os.makedirs(output_folder, exist_ok=True)
+    outputs = [os.path.join(output_folder, os.path.basename(f)) for f in files]
+    written = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(orient_png, src, dst, degrees): src for src, dst in zip(files, outputs)}
+        for future, src in futures.items():
+            try:
+                written.append(future.result())
+            except BaseException as e:
+                logger.error(f'Error rotating {src}:\n\t{e}')
+    logger.info(f'Rotated {len(written)} of {len(files)} PNGs by {degrees} degrees clockwise')
+    return written
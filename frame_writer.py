@@ -0,0 +1,104 @@
+# Background writer stage for extracted frames.
+# Frames are encoded into in-memory buffers (cv2.imencode / PIL into BytesIO, both release
+# the GIL while encoding) and written by a small thread pool, each file going to a temp
+# name and renamed into place. Output folders are created once per folder instead of being
+# checked on every frame, so the decode loop no longer waits on NFS write latency.
+
+import io
+import os
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from fs_utils import atomic_write_bytes
+from frame_transform import ORIENTATIONS, rotate as rotate_frame, set_png_orientation
+
+logger = logging.getLogger(__name__)
+
+
+def encode_image(image, ext, rotate=0, exif_orientation=False):
+    """ Encode a BGR frame to the bytes of a .png or .avif file, rotated clockwise by rotate degrees.
+
+    With exif_orientation a PNG keeps its pixels and records the rotation as EXIF orientation.
+    """
+    if rotate and exif_orientation and ext == '.png':
+        return set_png_orientation(encode_image(image, ext), ORIENTATIONS[rotate % 360])
+    if rotate:
+        image = rotate_frame(image, rotate)
+    if ext == '.avif':
+        import cv2
+        from PIL import Image
+        buffer = io.BytesIO()
+        Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB)).save(buffer, 'AVIF', quality_mode='q', quality_level=100)
+        return buffer.getvalue()
+    import cv2
+    success, data = cv2.imencode(ext, image)
+    if not success:
+        raise ValueError(f'Could not encode frame as {ext}')
+    return data.tobytes()
+
+
+class FrameWriter:
+    """ Bounded pool of writer threads; at most max_pending frames are queued or being written.
+
+    Use as a context manager, leaving it waits for every write. written and failed hold the
+    paths of the finished writes.
+    """
+
+    def __init__(self, workers=4, max_pending=None, fsync=False):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='frame-writer')
+        self.max_pending = max_pending or workers * 4
+        self.slots = threading.BoundedSemaphore(self.max_pending)
+        self.fsync = fsync
+        self.lock = threading.Lock()
+        self.dirs = set()
+        self.written = []
+        self.failed = []
+
+    def _ensure_dir(self, folder):
+        if folder in self.dirs:
+            return
+        os.makedirs(folder or '.', exist_ok=True)
+        with self.lock:
+            self.dirs.add(folder)
+
+    def _write(self, path, data, image, ext, rotate=0, exif_orientation=False):
+        try:
+            if data is None:
+                data = encode_image(image, ext, rotate, exif_orientation)
+            elif isinstance(data, Future):
+                data = data.result()
+            self._ensure_dir(os.path.dirname(path))
+            atomic_write_bytes(path, data, self.fsync)
+            with self.lock:
+                self.written.append(path)
+            return path
+        except BaseException as e:
+            logger.error(f'Failed to write {path}:\n\t{e}')
+            with self.lock:
+                self.failed.append(path)
+            raise
+        finally:
+            self.slots.release()
+
+    def submit(self, path, data):
+        """ Queue encoded bytes for path, blocks while max_pending writes are outstanding.
+
+        data can also be a Future of the bytes (e.g. from an encoder process pool), the
+        writer thread then waits for it.
+        """
+        self.slots.acquire()
+        return self.executor.submit(self._write, path, data, None, None)
+
+    def submit_image(self, path, image, ext=None, rotate=0, exif_orientation=False):
+        """ Queue a BGR frame, rotated and encoded on the writer thread to the format of path's extension. """
+        self.slots.acquire()
+        return self.executor.submit(self._write, path, None, image, ext or os.path.splitext(path)[1], rotate, exif_orientation)
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
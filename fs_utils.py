@@ -0,0 +1,41 @@
+# Small filesystem helpers shared by the extractors.
+# Outputs are written to a hidden temp file in the destination folder and renamed into
+# place, so a crash never leaves a truncated frame under its final name.
+
+import os
+from contextlib import contextmanager
+
+
+def temp_path(path):
+    """ Hidden temp name next to path, on the same filesystem so the rename is atomic. """
+    folder, name = os.path.split(path)
+    return os.path.join(folder, f'.{name}.{os.getpid()}.tmp')
+
+
+def fsync_file(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+@contextmanager
+def atomic_output(path, fsync=False):
+    """ Yield a temp path to write to; it replaces path only if the block completes. """
+    tmp = temp_path(path)
+    try:
+        yield tmp
+        if fsync:
+            fsync_file(tmp)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def atomic_write_bytes(path, data, fsync=False):
+    with atomic_output(path, fsync) as tmp:
+        with open(tmp, 'wb') as f:
+            f.write(data)
@@ -8,15 +8,16 @@ import pillow_avif
 from PIL import Image
 import pillow_avif
 #from pathlib import Path
-import logging
-import sys
-#import time
+from log_setup import get_logger
+import time
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from frame_index import get_index
+from frame_record import parse_frame_path
+from fs_utils import atomic_output
 
 
-logging.basicConfig(filename='alt_frame_processing.log', level=logging.INFO)
-logger = logging.getLogger(__name__)
-logger.addHandler(logging.FileHandler('alt_frame_processing.log'))
-logger.addHandler(logging.StreamHandler(sys.stdout))
+logger = get_logger(__name__, 'alt_frame_processing.log')
 
 def avif_to_png(avif_path):
     # Convert AVIF to PNG using pillow_avif
@@ -44,15 +45,15 @@ def convert_avif_to_png(image_in):
 
 def get_camera_number(mp4_path):
     # Extract the camera number from the mp4_path
-    return mp4_path.split('/')[-1].split('-')[0]
+    return parse_frame_path(mp4_path).camera
 
 def get_pose(mp4_path):
     # Extract the pose from the mp4_path
-    return mp4_path.split('/')[-2]
+    return parse_frame_path(mp4_path).pose
 
 def get_model(mp4_path):
     # Extract the model from the mp4_path
-    return mp4_path.split('/')[-3]
+    return parse_frame_path(mp4_path).model
 
 def rename_frame(frame_path, camera_number):
     # Rename the frame file to include the camera number
@@ -62,6 +63,9 @@ def rename_frame(frame_path, camera_number):
 
 def process_frames(frames_root, camera_numbers, frame_number, out_dir):
     # for each camera folder in frames_root, find those avif files matching frame_number
+    # one incremental index scan of frames_root replaces walking every camera folder
+    index = get_index()
+    index.scan(frames_root)
     for camera_number in camera_numbers:
         camera_folder = os.path.join(frames_root, camera_number)
         if not os.path.exists(camera_folder):
@@ -69,18 +73,66 @@ def process_frames(frames_root, camera_numbers, frame_number, out_dir):
             continue
 
         # look for avif files in the camera folder
-        for root, dirs, files in os.walk(camera_folder):
-            for file in files:
-                if file.endswith('.png') and f'-{frame_number}.' in file:
-                    avif_path = os.path.join(root, file)
-                    # convert_avif_to_png(avif_path)
-                    png_path = avif_path.replace('.avif', '.png')
-                    renamed_frame_path = rename_frame(png_path, camera_number)
-                    logger.info(f'Processed frame: {renamed_frame_path}')
-                    # Move the renamed frame to out_dir
-                    if not os.path.exists(out_dir):
-                        os.makedirs(out_dir)
-                    os.rename(renamed_frame_path, os.path.join(out_dir, os.path.basename(renamed_frame_path)))
+        for file_path in index.files(camera_folder, '.png'):
+            file = os.path.basename(file_path)
+            if f'-{frame_number}.' in file:
+                avif_path = file_path
+                # convert_avif_to_png(avif_path)
+                png_path = avif_path.replace('.avif', '.png')
+                renamed_frame_path = rename_frame(png_path, camera_number)
+                logger.info(f'Processed frame: {renamed_frame_path}')
+                # Move the renamed frame to out_dir
+                if not os.path.exists(out_dir):
+                    os.makedirs(out_dir)
+                os.rename(renamed_frame_path, os.path.join(out_dir, os.path.basename(renamed_frame_path)))
+
+
+def export_frame_as_png(frame_path, png_path):
+    # worker: decode one AVIF (or copy a PNG) into png_path, returns the seconds it took
+    start = time.time()
+    with atomic_output(png_path) as tmp:
+        if frame_path.endswith('.avif'):
+            with Image.open(frame_path) as im:
+                im.save(tmp, 'PNG')
+        else:
+            shutil.copyfile(frame_path, tmp)
+    return time.time() - start
+
+
+def export_modeling_frames(frames_root, camera_numbers, frame_number, out_dir, workers=None):
+    # one index lookup finds frame_number for every camera under frames_root, the AVIFs are
+    # decoded in a process pool straight to out_dir/<camera>_<name>.png, sources are left untouched
+    start = time.time()
+    index = get_index()
+    index.scan(frames_root)
+    sources = {}
+    for ext in ('.png', '.avif'):
+        # AVIF wins when a camera has both
+        for path in index.lookup(root=frames_root, frame=int(frame_number), ext=ext):
+            camera = parse_frame_path(path).camera
+            if camera in camera_numbers:
+                sources[camera] = path
+    missing = [camera for camera in camera_numbers if camera not in sources]
+    for camera in missing:
+        logger.warning(f'Frame {frame_number} not found for {camera}')
+    os.makedirs(out_dir, exist_ok=True)
+    timings = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {}
+        for camera, path in sorted(sources.items()):
+            name = os.path.splitext(os.path.basename(path))[0] + '.png'
+            futures[camera] = executor.submit(export_frame_as_png, path, os.path.join(out_dir, f'{camera}_{name}'))
+        for camera, future in futures.items():
+            try:
+                timings[camera] = future.result()
+                logger.info(f'{camera}: {timings[camera]:.2f} sec')
+            except BaseException as e:
+                logger.error(f'Error exporting {sources[camera]}:\n\t{e}')
+    if timings:
+        slowest = max(timings, key=timings.get)
+        logger.info(f'Exported {len(timings)} of {len(camera_numbers)} cameras to {out_dir} in {time.time() - start:.2f} sec '
+                    f'(mean {sum(timings.values()) / len(timings):.2f} sec, slowest {slowest} {timings[slowest]:.2f} sec)')
+    return timings, missing
 
 
 if __name__ == '__main__':
@@ -104,9 +156,17 @@ if __name__ == '__main__':
     frame_number = '00003'  # Frame number to look for
     # out_dir = '/Users/spooky/Developer/facebuilder/Auto-Only-Plugin/alt_source/'  # Directory to save processed frames
     out_dir = f'/Users/spooky/modeling_frames/{model}/EXP_eye_neutral/'  # Directory to save processed frames
-    if not os.path.exists(out_dir):
-        os.makedirs(out_dir, exist_ok=True)
-  # Directory to save processed frames
 
-    process_frames(frames_root, camera_numbers, frame_number, out_dir)
+    import argparse
+    parser = argparse.ArgumentParser(description='Export one frame of every camera as renamed PNGs for modeling.')
+    parser.add_argument('frames_root', nargs='?', default=frames_root, help='Pose folder containing the camera folders')
+    parser.add_argument('frame_number', nargs='?', default=frame_number, help='Frame number to export')
+    parser.add_argument('out_dir', nargs='?', default=out_dir, help='Folder for the modeling set')
+    parser.add_argument('--cameras', type=int, nargs='+', default=None, help='Camera numbers (default 1-86)')
+    parser.add_argument('--workers', type=int, default=None, help='Decode processes')
+    args = parser.parse_args()
+    if args.cameras:
+        camera_numbers = [f'camera_{str(i).zfill(2)}' for i in args.cameras]
+
+    export_modeling_frames(args.frames_root, camera_numbers, args.frame_number, args.out_dir, args.workers)
     logger.info('Frame processing completed.')
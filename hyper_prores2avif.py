@@ -1,23 +1,65 @@
 import os
+import shutil
+import tempfile
 import subprocess
 import multiprocessing
 import time
-import logging
+from log_setup import get_logger
+from job_scheduler import Job, run_jobs, measure_frames
+from frame_index import get_index
+from fs_utils import fsync_file
+from checkpoint_journal import CheckpointJournal
+from count_frames import get_frame_rate
+from output_cache import get_cache
 
 # Configure logging
-logging.basicConfig(
-    filename="avif_extraction.log",
-    level=logging.INFO,
-    format="%(asctime)s [%(levelname)s] %(message)s"
-)
+logger = get_logger(__name__, "avif_extraction.log")
 
 # Ensure proper multiprocessing start method
 multiprocessing.set_start_method("spawn", force=True)
 
-def extract_frames(input_file):
+OUTPUT_ROOT = "/mnt/data/datasets/LA-June-frames"
+
+
+def get_output_dir(input_file, output_root=OUTPUT_ROOT):
+    """ Frames for a clip land in a folder named after the clip. """
+    return os.path.join(output_root, os.path.splitext(os.path.basename(input_file))[0])
+
+
+def get_existing_frames(output_dir, basename):
+    """ Return {frame number: path} for frames already on disk for basename, from a single directory listing. """
+    prefix = f"{basename}-"
+    existing = {}
+    for name in os.listdir(output_dir):
+        if name.startswith(prefix) and name.endswith(".avif"):
+            try:
+                existing[int(name[len(prefix):-len(".avif")])] = os.path.join(output_dir, name)
+            except ValueError:
+                pass
+    return existing
+
+
+def publish_frames(staging_dir, output_dir, basename, journal, finished):
+    """ Move completed frames from the staging folder into output_dir and journal them.
+
+    The segment muxer closes a frame before opening the next one, so every staged frame but
+    the newest is complete while ffmpeg is still running; once it exits cleanly all are.
+    """
+    staged = sorted(get_existing_frames(staging_dir, basename).items())
+    if not finished:
+        staged = staged[:-1]
+    for frame_num, staged_path in staged:
+        fsync_file(staged_path)
+        output_file = os.path.join(output_dir, os.path.basename(staged_path))
+        os.replace(staged_path, output_file)
+        journal.add(frame_num, output_file)
+    return len(staged)
+
+
+def extract_frames(input_file, output_dir=None, threads=0):
 
     """ Extract frames from an input file as AVIF, tracking estimated time. """
-    output_dir = f"/mnt/data/datasets/LA-June-frames/{os.path.splitext(os.path.basename(input_file))[0]}"
+    output_dir = output_dir or get_output_dir(input_file)
     os.makedirs(output_dir, exist_ok=True)
     basename = str(os.path.basename(input_file)).split('.')[0]
     frame_num = 0
@@ -26,7 +68,7 @@ def extract_frames(input_file):
     while True:
         output_file = os.path.join(output_dir, f"{basename}-{frame_num:04d}.avif")
         if os.path.exists(output_file):
-            # logging.info(f"Skipping frame {frame_num} (already processed) for {input_file}")
+            # logger.info(f"Skipping frame {frame_num} (already processed) for {input_file}")
             frame_num += 1
             continue
 
@@ -37,7 +79,7 @@ def extract_frames(input_file):
         #     "-y"
         # ]
         cmd = [
-            "ffmpeg", "-i", input_file, "-vf",
+            "ffmpeg", "-threads", str(threads), "-i", input_file, "-vf",
             f"select='eq(n,{frame_num})',colorspace=bt709",
             "-vsync", "vfr", "-pix_fmt", "yuv420p", "-quality", "50", output_file,
             "-y"
@@ -45,36 +87,154 @@ def extract_frames(input_file):
         result = subprocess.run(cmd, capture_output=True, text=True)
 
         if result.returncode != 0:
-            logging.warning(f"EOF:\t{frame_num}\t{input_file}\tRETURNCODE:\t{result.returncode}")
+            logger.warning(f"EOF:\t{frame_num}\t{input_file}\tRETURNCODE:\t{result.returncode}")
             break
 
         elapsed_time = time.time() - start_time
         avg_time_per_frame = elapsed_time / (frame_num + 1)
         estimated_remaining_time = avg_time_per_frame * (150000 - frame_num)
 
-        # logging.info(f"Extracted frame {frame_num} from {input_file} | Est. Remaining Time: {estimated_remaining_time:.2f} sec")
+        # logger.info(f"Extracted frame {frame_num} from {input_file} | Est. Remaining Time: {estimated_remaining_time:.2f} sec")
 
         frame_num += 1
 
     total_time = time.time() - start_time
-    logging.info(f"Frame extraction complete for {input_file} | Total Time: {total_time:.2f} sec")
+    logger.info(f"Frame extraction complete for {input_file} | Total Time: {total_time:.2f} sec")
 
-def process_multiple_files(input_files):
-    """ Process multiple MOV files in parallel, tracking time per file. """
-    processes = []
+# encode settings of extract_frames_streaming, the output cache key of its frames
+STREAMING_PARAMS = {'format': '.avif', 'quality': 50, 'pix_fmt': 'yuv420p', 'colorspace': 'bt709'}
 
-    for input_file in input_files:
-        print(f"Processing {input_file}")
-        p = multiprocessing.Process(target=extract_frames, args=(input_file,))
-        p.start()
-        processes.append(p)
 
-    for p in processes:
-        # report progress every 10 seconds
-        while p.is_alive():
-            time.sleep(10)
-            logging.info(f"Process {p.name} is still running...")
-        p.join()
+def restore_cached_frames(input_file, output_dir, basename, journal, cache, fingerprint):
+    """ Link frames already encoded from this source into output_dir and journal them; returns the number linked. """
+    frame_count = measure_frames(input_file)
+    restored = 0
+    for start, end in journal.missing_ranges():
+        for frame_num in range(start, frame_count if end is None else min(end + 1, frame_count)):
+            path = os.path.join(output_dir, f"{basename}-{frame_num:04d}.avif")
+            if cache.restore(fingerprint, frame_num, STREAMING_PARAMS, path):
+                journal.add(frame_num, path)
+                restored += 1
+    if frame_count and journal.frame_count is None and all(journal.is_complete(f) for f in range(frame_count)):
+        journal.finish(frame_count)
+    elif restored:
+        journal.save()
+    if restored:
+        logger.info(f"Linked {restored} cached frames of {input_file}")
+    return restored
+
+
+def decodes_standalone(frame_path):
+    """ True if ffmpeg decodes frame_path by itself, without errors. """
+    result = subprocess.run(["ffmpeg", "-v", "error", "-i", frame_path, "-frames:v", "1", "-f", "null", "-"],
+                            capture_output=True, text=True)
+    return result.returncode == 0 and not result.stderr.strip()
+
+
+def extract_frames_streaming(input_file, output_dir=None, threads=0, poll_interval=0.5, use_cache=True):
+    """ Extract every frame of input_file as AVIF from a single decode of each missing range.
+
+    Progress is kept in a checkpoint journal, so a restarted job seeks straight to the first
+    incomplete frame instead of checking every output file. Frames are encoded into a staging
+    folder and only renamed into place once complete, so truncated outputs never appear.
+
+    Returns the number of frames extracted by this call; raises RuntimeError if ffmpeg failed
+    or the clip still has missing frames, so scheduled jobs exit non-zero.
+    """
+    output_dir = output_dir or get_output_dir(input_file)
+    os.makedirs(output_dir, exist_ok=True)
+    basename = str(os.path.basename(input_file)).split('.')[0]
+    start_time = time.time()
+
+    journal = CheckpointJournal(output_dir, basename, source=input_file)
+    if journal.is_new:
+        # frames written before journaling was added
+        journal.adopt(get_existing_frames(output_dir, basename))
+    cache = get_cache() if use_cache else None
+    if cache:
+        fingerprint = cache.fingerprint(input_file)
+        restore_cached_frames(input_file, output_dir, basename, journal, cache, fingerprint)
+    staging_dir = os.path.join(output_dir, f".partial-{basename}")
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    os.makedirs(staging_dir)
+    fps = get_frame_rate(input_file)
+    done_before = set(journal.frames)
+    failure = None
+
+    for start, end in journal.missing_ranges():
+        cmd = ["ffmpeg", "-y", "-v", "error", "-threads", str(threads)]
+        if start > 0 and fps:
+            # ProRes is intra-only, so an accurate seek lands exactly on frame `start`: frame start-1
+            # sits half a frame before the seek point and is dropped, frame start is kept
+            cmd += ["-ss", f"{(start - 0.5) / fps:.6f}", "-i", input_file, "-vf", "colorspace=bt709"]
+        else:
+            cmd += ["-i", input_file, "-vf", f"select='gte(n,{start})',colorspace=bt709"]
+        # -g 1 makes every frame a keyframe: each output file must decode on its own, an inter
+        # frame cut out of a normal GOP would reference frames in other files
+        cmd += ["-vsync", "vfr", "-pix_fmt", "yuv420p", "-quality", "50", "-g", "1"]
+        if end is not None:
+            cmd += ["-frames:v", str(end - start + 1)]
+        # the segment muxer gives every frame its own .avif file (the image2 muxer cannot write AVIF),
+        # numbered from the first frame of the range so names match the per-frame extractor
+        cmd += [
+            "-f", "segment", "-segment_format", "avif", "-segment_time", "0.0001",
+            "-reset_timestamps", "1",
+            "-segment_start_number", str(start),
+            os.path.join(staging_dir, f"{basename}-%04d.avif"),
+        ]
+        with tempfile.TemporaryFile(mode="w+") as stderr:
+            process = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=stderr)
+            published = 0
+            while process.poll() is None:
+                time.sleep(poll_interval)
+                published += publish_frames(staging_dir, output_dir, basename, journal, finished=False)
+            returncode = process.wait()
+            # a failed run may have left its last frame half written, it stays in staging and is discarded
+            published += publish_frames(staging_dir, output_dir, basename, journal, finished=returncode == 0)
+            journal.save()
+            stderr.seek(0)
+            errors = stderr.read()
+
+        if returncode != 0:
+            logger.warning(f"FAILED:\t{start}-{end}\t{input_file}\tRETURNCODE:\t{returncode}\n{errors[-2000:]}")
+            failure = f"ffmpeg exited with {returncode} extracting frames {start}-{end} of {input_file}"
+            break
+        if end is None:
+            # the open tail ran to the end of the clip
+            journal.finish(start + published)
+
+    shutil.rmtree(staging_dir, ignore_errors=True)
+    new_frames = sorted(set(journal.frames) - done_before)
+    if len(new_frames) > 1:
+        # only frames this call encoded say anything about its encode; one from the middle of
+        # them is never the first of a segment run, so it only decodes if the encode was all-intra
+        middle = new_frames[len(new_frames) // 2]
+        middle_path = os.path.join(output_dir, f"{basename}-{middle:04d}.avif")
+        if not decodes_standalone(middle_path):
+            logger.error(f"Frame {middle} of {input_file} does not decode on its own: {middle_path}")
+    if cache:
+        cache.store(fingerprint, {frame_num: os.path.join(output_dir, f"{basename}-{frame_num:04d}.avif")
+                                  for frame_num in journal.frames}, STREAMING_PARAMS)
+    get_index().scan(output_dir)
+    total_time = time.time() - start_time
+    extracted = len(new_frames)
+    expected = measure_frames(input_file) or journal.frame_count
+    if failure is None and expected and len(journal.frames) < expected:
+        failure = f"only {len(journal.frames)} of {expected} frames of {input_file} were extracted"
+    if failure:
+        raise RuntimeError(failure)
+    logger.info(f"Frame extraction complete for {input_file} | {extracted} frames | Total Time: {total_time:.2f} sec")
+    return extracted
+
+
+def process_multiple_files(input_files, extractor=extract_frames_streaming, core_budget=None, io_budget=None, threads_per_job=4):
+    """ Process multiple MOV files through the shared scheduler, longest clips first. """
+    jobs = []
+    for input_file in input_files:
+        frames = measure_frames(input_file)
+        print(f"Queued {input_file} ({frames} frames)")
+        jobs.append(Job(os.path.basename(input_file), extractor, (input_file, None, threads_per_job), frames, threads_per_job))
+    return run_jobs(jobs, core_budget, io_budget)
 
 
 
@@ -84,6 +244,10 @@ if __name__ == "__main__":
     import argparse
     parser = argparse.ArgumentParser(description="Extract frames from ProRes .mov files and save as AVIF images.")
     parser.add_argument('input_folder', type=str, help='Folder containing ProRes .mov files')
+    parser.add_argument('--cores', type=int, default=None, help='Core budget shared by all jobs (default: all cores)')
+    parser.add_argument('--io-jobs', type=int, default=None, help='Maximum number of clips read at once (default: no limit beyond the core budget)')
+    parser.add_argument('--threads', type=int, default=4, help='ffmpeg threads per clip')
+    parser.add_argument('--per-frame', action='store_true', help='Use the legacy extractor that relaunches ffmpeg for every frame')
     args = parser.parse_args()
     input_folder = args.input_folder
     # recursively find all .mov files in the input folder
@@ -100,4 +264,5 @@ if __name__ == "__main__":
         print(f"No .mov files found in {input_folder}")
     else:
         print(f"Found {len(input_files)} .mov files to process.")
-        process_multiple_files(input_files)
+        process_multiple_files(input_files, extract_frames if args.per_frame else extract_frames_streaming,
+                               args.cores, args.io_jobs, args.threads)
@@ -0,0 +1,111 @@
+# Shared scheduler for per-file extraction jobs.
+# Each job declares how many cores it will use (ffmpeg threads) and how many frames it
+# is expected to produce. Jobs are started longest first and only while the core and IO
+# budgets allow, so a folder of 80 clips no longer starts 80 ffmpeg processes at once.
+
+import os
+import time
+import queue
+import logging
+import multiprocessing
+
+logger = logging.getLogger(__name__)
+
+
+class Job:
+    """ A unit of work for run_jobs: target(*args) run in its own process.
+
+    target returns the number of frames it wrote and raises (exits non-zero) on failure;
+    frames is only the expected count used to order jobs.
+    """
+
+    def __init__(self, name, target, args=(), frames=0, cores=1):
+        self.name = name
+        self.target = target
+        self.args = args
+        self.frames = frames
+        self.cores = cores
+        self.process = None
+        self.start_time = None
+
+
+def measure_frames(input_file):
+    """ Expected frame count for scheduling, 0 if it cannot be measured. """
+    from count_frames import get_frame_count
+    try:
+        return get_frame_count(input_file)
+    except Exception as e:
+        logger.warning(f'Could not count frames for {input_file}: {e}')
+        return 0
+
+
+def _run_job(target, args, name, results):
+    # child side of a job: report the frames target wrote back to run_jobs
+    results.put((name, target(*args)))
+
+
+def run_jobs(jobs, core_budget=None, io_budget=None, poll_interval=1.0, report_interval=10.0):
+    """ Run jobs longest first within a core budget and an IO budget (max concurrent jobs).
+
+    Returns the aggregate throughput in frames/sec, counted from the frames the jobs report
+    as written, not from their expected counts.
+    """
+    core_budget = core_budget or os.cpu_count()
+    io_budget = io_budget or core_budget
+    ctx = multiprocessing.get_context("spawn")
+    results = ctx.Queue()
+    written = {}
+
+    pending = sorted(jobs, key=lambda job: job.frames, reverse=True)
+    running = []
+    frames_done = 0
+    failed = 0
+    start_time = time.time()
+    last_report = start_time
+
+    while pending or running:
+        # start as many jobs as the budgets allow, a job larger than the whole budget runs alone
+        cores_in_use = sum(job.cores for job in running)
+        while pending and len(running) < io_budget and (not running or cores_in_use + pending[0].cores <= core_budget):
+            job = pending.pop(0)
+            job.process = ctx.Process(target=_run_job, args=(job.target, job.args, job.name, results), name=job.name)
+            job.start_time = time.time()
+            job.process.start()
+            running.append(job)
+            cores_in_use += job.cores
+            logger.info(f'Started {job.name} ({job.frames} frames, {job.cores} cores)')
+
+        time.sleep(poll_interval)
+
+        for job in [job for job in running if not job.process.is_alive()]:
+            job.process.join()
+            running.remove(job)
+            elapsed = time.time() - job.start_time
+            if job.process.exitcode == 0:
+                # the child flushed its result before exiting, it is in the queue by now
+                while job.name not in written:
+                    try:
+                        name, frames = results.get(timeout=5)
+                    except queue.Empty:
+                        logger.warning(f'{job.name} did not report the frames it wrote')
+                        break
+                    written[name] = frames
+                frames = written.get(job.name) or 0
+                frames_done += frames
+                if frames < job.frames:
+                    logger.info(f'{job.name} wrote {frames} of {job.frames} expected frames, the rest were already done')
+                logger.info(f'Finished {job.name} in {elapsed:.2f} sec ({frames / max(elapsed, 1e-6):.2f} frames/sec)')
+            else:
+                failed += 1
+                logger.error(f'{job.name} exited with code {job.process.exitcode} after {elapsed:.2f} sec')
+
+        now = time.time()
+        if now - last_report >= report_interval:
+            last_report = now
+            logger.info(f'{len(running)} running, {len(pending)} pending, {frames_done} frames done, '
+                        f'{frames_done / (now - start_time):.2f} frames/sec')
+
+    total_time = time.time() - start_time
+    throughput = frames_done / max(total_time, 1e-6)
+    logger.info(f'All jobs complete: {frames_done} frames in {total_time:.2f} sec ({throughput:.2f} frames/sec), {failed} failed')
+    return throughput
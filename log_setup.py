@@ -0,0 +1,135 @@
+# Shared logging setup for all scripts.
+# Records are handed to a queue and written by a background listener thread, so the
+# extraction loops never block on log I/O. Each log file gets exactly one handler (the
+# old basicConfig + extra FileHandler pattern wrote every line twice), and per-frame
+# messages are replaced by periodic ProgressLogger records with frames/sec and ETA.
+# Set VID_CONVERT_LOG_JSON=1 to write the log files as JSON lines.
+
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import logging
+from logging.handlers import QueueHandler, QueueListener
+
+TEXT_FORMAT = '%(asctime)s [%(levelname)s] %(name)s: %(message)s'
+JSON_OUTPUT = os.environ.get('VID_CONVERT_LOG_JSON', '') not in ('', '0')
+
+_listeners = {}
+
+
+class JsonFormatter(logging.Formatter):
+    """ One JSON object per line, structured progress fields are kept as numbers. """
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        if hasattr(record, 'progress'):
+            entry['progress'] = record.progress
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+
+class ProcessAwareQueueHandler(QueueHandler):
+    """ Queues records in the process that started the listener; forked workers have no
+    listener thread, so they write straight to the inherited handlers instead. """
+
+    def __init__(self, log_queue, listener):
+        super().__init__(log_queue)
+        self.listener = listener
+        self.pid = os.getpid()
+
+    def emit(self, record):
+        if os.getpid() == self.pid:
+            super().emit(record)
+        else:
+            for handler in self.listener.handlers:
+                if record.levelno >= handler.level:
+                    handler.handle(record)
+
+
+def _listener_for(filename, json_output):
+    key = (filename, json_output)
+    if key not in _listeners:
+        console = logging.StreamHandler(sys.stdout)
+        console.setFormatter(logging.Formatter(TEXT_FORMAT))
+        handlers = [console]
+        if filename:
+            file_handler = logging.FileHandler(filename)
+            file_handler.setFormatter(JsonFormatter() if json_output else logging.Formatter(TEXT_FORMAT))
+            handlers.append(file_handler)
+        listener = QueueListener(queue.SimpleQueue(), *handlers, respect_handler_level=True)
+        listener.start()
+        # flush everything still queued when the interpreter exits
+        atexit.register(listener.stop)
+        _listeners[key] = listener
+    return _listeners[key]
+
+
+def get_logger(name=None, filename=None, level=logging.INFO, json_output=JSON_OUTPUT):
+    """ Logger writing through a non-blocking queue to filename and stdout, configured once per name.
+
+    The root logger is pointed at the first file configured, so helper modules that use
+    logging.getLogger(__name__) end up in the calling script's log.
+    """
+    logger = logging.getLogger(name)
+    if getattr(logger, '_vid_convert_handler', None) is None:
+        listener = _listener_for(filename, json_output)
+        handler = ProcessAwareQueueHandler(listener.queue, listener)
+        logger.addHandler(handler)
+        logger.setLevel(level)
+        logger._vid_convert_handler = handler
+        if name is not None:
+            logger.propagate = False
+            root = logging.getLogger()
+            if not root.handlers:
+                get_logger(None, filename, level, json_output)
+    return logger
+
+
+class ProgressLogger:
+    """ Aggregates per-item updates into one progress record every interval seconds. """
+
+    def __init__(self, logger, label, total=None, interval=10.0, unit='frames'):
+        self.logger = logger
+        self.label = label
+        self.total = total
+        self.interval = interval
+        self.unit = unit
+        self.count = 0
+        self.start = time.time()
+        self.last_report = self.start
+
+    def _record(self, final=False):
+        elapsed = time.time() - self.start
+        rate = self.count / elapsed if elapsed > 0 else 0.0
+        progress = {'label': self.label, 'count': self.count, 'total': self.total,
+                    'elapsed_sec': round(elapsed, 2), 'rate': round(rate, 2), 'unit': self.unit}
+        message = f'{self.label}: {self.count}'
+        if self.total:
+            message += f'/{self.total}'
+            if not final and rate > 0:
+                progress['eta_sec'] = round((self.total - self.count) / rate, 1)
+        message += f' {self.unit} in {elapsed:.1f} sec ({rate:.2f} {self.unit}/sec)'
+        if 'eta_sec' in progress:
+            message += f', ETA {progress["eta_sec"]:.0f} sec'
+        if final:
+            message += ' - done'
+        self.logger.info(message, extra={'progress': progress})
+
+    def update(self, n=1):
+        self.count += n
+        now = time.time()
+        if now - self.last_report >= self.interval:
+            self.last_report = now
+            self._record()
+
+    def done(self):
+        self._record(final=True)
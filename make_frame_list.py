@@ -2,28 +2,27 @@
 # each row should contain the pose and frame number, from 0-the last frame, skipping every Nth frame
 # output should be a CSV file with the following columns:
 # - pose, frame_id
+# The same sampling plan (a stride, an explicit index list or a pose,frame_id CSV) drives
+# extract_sampled_frames, which decodes and encodes only the planned frames: sparse plans
+# seek keyframe to keyframe, dense ones are decoded sequentially (see batch_frames).
 
 # get list of mp4 files in LA-data
 import os
-import pandas as pd
-import logging
-import sys
-from datetime import datetime
-from process_mp4 import get_all_mp4s, get_all_pngs, get_all_avifs
-from pathlib import Path
-import cv2
+import csv
 import time
-import pillow_avif
-from PIL import Image
-from process_mp4 import convert_png_to_avif, get_camera_number_from_path, get_frame_number_from_path
+from log_setup import get_logger
+from process_mp4 import get_all_mp4s, pad_frame_number
+from count_frames import get_frame_count
+from batch_frames import extract_frames_batch
+from frame_index import get_index
+from frame_record import parse_frame_path
 
 # Set up logging
-logging.basicConfig(filename='make_frame_list.log', level=logging.INFO)
-logger = logging.getLogger(__name__)
-logger.addHandler(logging.FileHandler('make_frame_list.log'))
-logger.addHandler(logging.StreamHandler(sys.stdout))
+logger = get_logger(__name__, 'make_frame_list.log')
 L_ROOT = '/Users/spooky/Downloads/LA-data-frames'
 R_ROOT = '/mnt/data/datasets/LA-data-frames'
+SRC_ROOT = '/mnt/data/datasets/LA-data/'
+
 
 def get_frame_list(mp4_path, frame_skip=1):
     """Get a list of frames from the mp4 file, skipping every Nth frame."""
@@ -31,11 +30,106 @@ def get_frame_list(mp4_path, frame_skip=1):
         logger.error(f'MP4 file not found: {mp4_path}')
         return []
 
-    vidcap = cv2.VideoCapture(mp4_path)
-    total_frames = int(vidcap.get(cv2.CAP_PROP_FRAME_COUNT))
-    frame_list = []
-    for i in range(0, total_frames, frame_skip):
-        frame_list.append(i)
-    return frame_list
+    # frame count comes from the container header, the clip is not opened for decoding
+    total_frames = get_frame_count(mp4_path)
+    return list(range(0, total_frames, frame_skip))
+
+
+def parse_frame_indices(text):
+    """ Frame numbers from a '0,10,25-40' style list, ranges are inclusive. """
+    frames = set()
+    for part in text.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        start, _, end = part.partition('-')
+        frames.update(range(int(start), int(end or start) + 1))
+    return sorted(frames)
+
+
+def get_pose(mp4_path):
+    return parse_frame_path(mp4_path).pose
+
+
+def write_frame_list(mp4_paths, output_csv, frame_skip=1):
+    """ Write the pose,frame_id plan for every pose of mp4_paths, sampled every frame_skip frames. """
+    poses = {}
+    for mp4_path in mp4_paths:
+        frames = get_frame_list(mp4_path, frame_skip)
+        # cameras of one pose can differ by a few frames, plan up to the longest clip
+        if len(frames) > len(poses.get(get_pose(mp4_path), [])):
+            poses[get_pose(mp4_path)] = frames
+    with open(output_csv, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['pose', 'frame_id'])
+        for pose in sorted(poses):
+            writer.writerows((pose, frame) for frame in poses[pose])
+    logger.info(f'Wrote {sum(len(frames) for frames in poses.values())} frames of {len(poses)} poses to {output_csv}')
+    return poses
+
+
+def read_frame_list(csv_path):
+    """ {pose: [frame_id, ...]} from a pose,frame_id CSV (header optional). """
+    poses = {}
+    with open(csv_path, newline='') as f:
+        for row in csv.reader(f):
+            if len(row) < 2 or not row[1].strip().isdigit():
+                continue
+            poses.setdefault(row[0].strip(), set()).add(int(row[1]))
+    return {pose: sorted(frames) for pose, frames in poses.items()}
+
+
+def build_plan(mp4_paths, frame_skip=None, frames=None, plan_csv=None):
+    """ {mp4_path: [frame numbers]} from exactly one of a stride, an explicit index list or a pose,frame_id CSV. """
+    if plan_csv:
+        poses = read_frame_list(plan_csv)
+        return {mp4_path: poses[get_pose(mp4_path)] for mp4_path in mp4_paths if get_pose(mp4_path) in poses}
+    if frames is not None:
+        return {mp4_path: list(frames) for mp4_path in mp4_paths}
+    return {mp4_path: get_frame_list(mp4_path, frame_skip or 1) for mp4_path in mp4_paths}
+
+
+def sampled_output(mp4_path, frame_number, src=SRC_ROOT, dst=R_ROOT, ext='.avif'):
+    # same layout as export_mp4_to_frames: <dst>/<model>/<pose>/<camera>/<pose>-<frame>.<ext>
+    # relpath against the absolute src, so a trailing slash or a relative src maps the same way
+    camera = parse_frame_path(mp4_path).camera
+    relative = os.path.relpath(os.path.dirname(os.path.abspath(mp4_path)), os.path.abspath(src))
+    return os.path.join(dst, relative, camera, f'{get_pose(mp4_path)}-{pad_frame_number(frame_number)}{ext}')
+
+
+def extract_sampled_frames(plan, src=SRC_ROOT, dst=R_ROOT, ext='.avif', workers=None, rotate=True, overwrite=False):
+    """ Decode and write only the frames of plan ({mp4_path: [frame numbers]}), returns the files written. """
+    requests = []
+    for mp4_path, frames in plan.items():
+        for frame_number in frames:
+            output_file = sampled_output(mp4_path, frame_number, src, dst, ext)
+            if overwrite or not os.path.exists(output_file):
+                requests.append((mp4_path, frame_number, output_file))
+    logger.info(f'Extracting {len(requests)} planned frames from {len(plan)} videos')
+    start = time.time()
+    written = extract_frames_batch(requests, rotate=rotate, workers=workers)
+    get_index().record(written)
+    logger.info(f'Wrote {len(written)} frames in {time.time() - start:.1f} sec')
+    return written
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Write a pose,frame_id sampling plan, or extract only the frames of a plan.')
+    parser.add_argument('src', type=str, help='Folder (searched recursively) of source mp4 clips')
+    parser.add_argument('--skip', type=int, default=None, help='Sample every Nth frame')
+    parser.add_argument('--frames', type=str, default=None, help="Explicit frame list, e.g. '0,10,25-40'")
+    parser.add_argument('--plan', type=str, default=None, help='pose,frame_id CSV to extract')
+    parser.add_argument('--write-plan', type=str, default=None, help='Write the pose,frame_id CSV for --skip and exit')
+    parser.add_argument('--dst', type=str, default=R_ROOT, help='Output root for extracted frames')
+    parser.add_argument('--ext', type=str, default='.avif', help='Output format (.avif or .png)')
+    parser.add_argument('--workers', type=int, default=None, help='Videos processed in parallel')
+    args = parser.parse_args()
 
-list
+    mp4_paths = get_all_mp4s(args.src)
+    if args.write_plan:
+        write_frame_list(mp4_paths, args.write_plan, args.skip or 1)
+    else:
+        frames = parse_frame_indices(args.frames) if args.frames else None
+        plan = build_plan(mp4_paths, args.skip, frames, args.plan)
+        extract_sampled_frames(plan, args.src, args.dst, args.ext, args.workers)
@@ -2,14 +2,110 @@ import cv2
 import numpy as np
 import os
 import csv
+import hashlib
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from frame_transform import rotate as rotate_frame
 
-def load_images_from_folder(folder):
-    images = {}
-    for filename in os.listdir(folder):
-        img = cv2.imread(os.path.join(folder, filename), cv2.IMREAD_GRAYSCALE)
+# ORB descriptors are cached on disk by file hash, so re-running against the same
+# calibration set only detects features for images that changed.
+# Images are decoded straight to a reduced resolution (ORB only needs enough detail to tell
+# camera views apart) one at a time, and descriptors of recently used files are kept in an
+# in-memory LRU so repeated runs in one process skip hashing and cache reads too.
+CACHE_DIR = os.path.expanduser("~/.vid_convert/orb_cache")
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".tif", ".tiff", ".bmp")
+# 1 = full resolution, 2/4/8 decode at 1/2, 1/4, 1/8 size, larger powers of two add pyrDown steps.
+# ORB finds different keypoints at a different scale, so matches.csv from the default 1/2
+# resolution can differ from a full-resolution (scale=1) run
+DEFAULT_SCALE = 2
+REDUCED_READ_FLAGS = {1: cv2.IMREAD_GRAYSCALE, 2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+                      4: cv2.IMREAD_REDUCED_GRAYSCALE_4, 8: cv2.IMREAD_REDUCED_GRAYSCALE_8}
+DESCRIPTOR_CACHE_SIZE = 1024
+
+_descriptor_cache = OrderedDict()
+
+def check_scale(scale):
+    if not isinstance(scale, int) or scale < 1 or scale & (scale - 1):
+        raise ValueError(f"scale must be a power of two (1, 2, 4, 8, ...), got {scale!r}")
+
+def load_image(path, scale=DEFAULT_SCALE):
+    """ Grayscale image decoded at 1/scale resolution, None if it cannot be read. """
+    check_scale(scale)
+    img = cv2.imread(path, REDUCED_READ_FLAGS[min(scale, 8)])
+    while img is not None and scale > 8:
+        img = cv2.pyrDown(img)
+        scale //= 2
+    return img
+
+def iter_images(folder, scale=DEFAULT_SCALE):
+    """ Lazily yield (filename, image) for the images in folder, one decoded image alive at a time. """
+    for filename in list_images(folder):
+        img = load_image(os.path.join(folder, filename), scale)
         if img is not None:
-            images[filename] = img
-    return images
+            yield filename, img
+
+def load_images_from_folder(folder, scale=DEFAULT_SCALE):
+    return dict(iter_images(folder, scale))
+
+def list_images(folder):
+    return sorted(f for f in os.listdir(folder) if f.lower().endswith(IMAGE_EXTENSIONS))
+
+def file_hash(path):
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def compute_descriptors(path, rotate=False, cache_dir=CACHE_DIR, scale=DEFAULT_SCALE):
+    """ ORB descriptors for one image, read from the cache when the file is unchanged. """
+    cache_file = os.path.join(cache_dir, f"{file_hash(path)}-{int(rotate)}-s{scale}.npy")
+    if os.path.exists(cache_file):
+        return np.load(cache_file)
+    img = load_image(path, scale)
+    if img is None:
+        return None
+    if rotate:
+        img = rotate_frame(img, 90)
+    _, des = cv2.ORB_create().detectAndCompute(img, None)
+    if des is None:
+        des = np.empty((0, 32), dtype=np.uint8)
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_file = f"{cache_file}.{os.getpid()}.tmp.npy"
+    np.save(tmp_file, des)
+    os.replace(tmp_file, cache_file)
+    return des
+
+def _descriptor_key(path, rotate, scale):
+    st = os.stat(path)
+    return os.path.abspath(path), st.st_size, st.st_mtime, rotate, scale
+
+def load_descriptors(folder, rotate=False, workers=None, cache_dir=CACHE_DIR, scale=DEFAULT_SCALE):
+    """ Descriptors for every image in folder, from the LRU or computed in parallel across processes. """
+    filenames = list_images(folder)
+    keys = {f: _descriptor_key(os.path.join(folder, f), rotate, scale) for f in filenames}
+    missing = [f for f in filenames if keys[f] not in _descriptor_cache]
+    if missing:
+        paths = [os.path.join(folder, f) for f in missing]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = executor.map(compute_descriptors, paths, [rotate] * len(paths),
+                                   [cache_dir] * len(paths), [scale] * len(paths))
+            for f, des in zip(missing, results):
+                if des is not None:
+                    _descriptor_cache[keys[f]] = des
+    descriptors = {}
+    for f in filenames:
+        if keys[f] in _descriptor_cache:
+            _descriptor_cache.move_to_end(keys[f])
+            descriptors[f] = _descriptor_cache[keys[f]]
+    while len(_descriptor_cache) > DESCRIPTOR_CACHE_SIZE:
+        _descriptor_cache.popitem(last=False)
+    return descriptors
+
+def count_matches(matcher, des1, des2):
+    if len(des1) == 0 or len(des2) == 0:
+        return 0
+    return len(matcher.match(des1, des2))
 
 def match_images(img1, img2):
     orb = cv2.ORB_create()
@@ -21,27 +117,41 @@ def match_images(img1, img2):
 
     return len(matches)  # Return number of matches as a similarity measure
 
-def process_folders(folder1, folder2, output_csv="matches.csv", match_threshold=50):
-    images1 = load_images_from_folder(folder1)
-    images2 = load_images_from_folder(folder2)
-
-    match_dict = {}
+_candidates = None
 
-    for filename1, img1 in images1.items():
-        best_match = None
-        best_match_count = 0
+def _init_matcher(candidates):
+    # each worker receives the folder2 descriptors once instead of once per task
+    global _candidates
+    _candidates = candidates
 
-        for filename2, img2 in images2.items():
-            rotated_img2 = cv2.rotate(img2, cv2.ROTATE_90_CLOCKWISE)
+def _best_match(args):
+    des1, match_threshold = args
+    matcher = cv2.BFMatcher(cv2.NORM_HAMMING, crossCheck=True)
+    best_match = None
+    best_match_count = 0
+    for filename2, des2 in _candidates:
+        match_count = count_matches(matcher, des1, des2)
+        if match_count > best_match_count and match_count > match_threshold:
+            best_match = filename2
+            best_match_count = match_count
+    return best_match
 
-            match_count = match_images(img1, rotated_img2)
+def process_folders(folder1, folder2, output_csv="matches.csv", match_threshold=50, workers=None, cache_dir=CACHE_DIR, scale=DEFAULT_SCALE):
+    """ Best folder2 match for every folder1 image, saved to output_csv.
 
-            if match_count > best_match_count and match_count > match_threshold:
-                best_match = filename2
-                best_match_count = match_count
+    Images are matched at 1/scale resolution, scale a power of two. The default of 2 is faster
+    but can pick different matches than scale=1, the full-resolution matching of earlier runs.
+    """
+    check_scale(scale)
+    descriptors1 = load_descriptors(folder1, False, workers, cache_dir, scale)
+    # folder2 images are compared rotated 90 degrees clockwise, rotate once at detection time
+    descriptors2 = load_descriptors(folder2, True, workers, cache_dir, scale)
+    candidates = list(descriptors2.items())
 
-        if best_match:
-            match_dict[filename1] = best_match
+    # many-to-many matching, one task per folder1 image against every folder2 image
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_matcher, initargs=(candidates,)) as executor:
+        best = executor.map(_best_match, [(des1, match_threshold) for des1 in descriptors1.values()])
+        match_dict = {filename1: best_match for filename1, best_match in zip(descriptors1, best) if best_match}
 
     # Save matches to a CSV file
     with open(output_csv, mode="w", newline="") as file:
@@ -53,9 +163,11 @@ def process_folders(folder1, folder2, output_csv="matches.csv", match_threshold=
     print(f"Matches saved to {output_csv}")
     return match_dict
 
-# Example usage
-folder1 = "/Users/spooky/modeling_frames/Model4/EXP_eye_neutral"
-folder2 = "/Users/spooky/Downloads/UNISON_Target_Stills"
-matches = process_folders(folder1, folder2)
+if __name__ == "__main__":
+    # Example usage
+    folder1 = "/Users/spooky/modeling_frames/Model4/EXP_eye_neutral"
+    folder2 = "/Users/spooky/Downloads/UNISON_Target_Stills"
+    # decode at 1/2 resolution, pass scale=1 for full-resolution matching
+    matches = process_folders(folder1, folder2, scale=DEFAULT_SCALE)
 
-print("Matching images:", matches)
+    print("Matching images:", matches)
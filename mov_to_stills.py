@@ -1,46 +1,32 @@
-import subprocess
 import os
-from multiprocessing import Pool
+from job_scheduler import Job, run_jobs, measure_frames
+from hyper_prores2avif import extract_frames_streaming
 # This script extracts frames from a ProRes .mov file and saves them as AVIF images.
 
 
-def extract_frames_avif(input_file, output_dir):
-    """ Extract frames from a ProRes .mov file and save as AVIF images. """
-    os.makedirs(output_dir, exist_ok=True)
-    basename = str(os.path.basename(input_file)).split('.')[0]
-    frame_num = 0
-    while True:
-        output_file = os.path.join(output_dir, f"{basename}-{frame_num:04d}.avif")
-        if os.path.exists(output_file):
-            # print(f"Skipping frame {frame_num} (already processed) for {input_file}")
-            frame_num += 1
-            continue
-        cmd = [
-            "ffmpeg", "-hwaccel cuda", "-i", input_file, "-vf",
-            f"select='eq(n,{frame_num})',colorspace=bt709",
-            "-vsync", "vfr", "-pix_fmt", "yuv420p", "-quality", "50", output_file,
-            "-y"
-        ]
-        print(f'Running command: {" ".join(cmd)}')
-        result = subprocess.run(cmd, capture_output=True, text=True)
-
-        # Stop when FFmpeg fails to extract a frame
-        if result.returncode != 0:
-            print(f"Stopping at frame {frame_num} for {input_file} - End of file reached.")
-            break
-
-        print(f"Extracted frame {frame_num} from {input_file}")
-        frame_num += 1
+def extract_frames_avif(input_file, output_dir, threads=0):
+    """ Extract frames from a ProRes .mov file and save as AVIF images.
 
+    Uses the journaled streaming extractor: one decode per missing range, atomic outputs,
+    and a restart resumes at the first incomplete frame. Returns the frames extracted, raises
+    RuntimeError when extraction failed or left frames missing.
+    """
+    extracted = extract_frames_streaming(input_file, output_dir, threads)
     print(f"Frame extraction complete for {input_file}")
+    return extracted
 
-def process_multiple_files(input_files):
-    """ Run frame extraction on multiple files in parallel. """
-    with Pool(os.cpu_count()) as pool:
-        pool.starmap(extract_frames_avif, [(file, f"/mnt/data/datasets/LA-June-frames/{os.path.splitext(os.path.basename(file))[0]}") for file in input_files])
+def process_multiple_files(input_files, core_budget=None, io_budget=None, threads_per_job=2):
+    """ Run frame extraction on multiple files through the shared scheduler, longest clips first. """
+    jobs = [Job(os.path.basename(file), extract_frames_avif,
+                (file, f"/mnt/data/datasets/LA-June-frames/{os.path.splitext(os.path.basename(file))[0]}", threads_per_job),
+                measure_frames(file), threads_per_job)
+            for file in input_files]
+    return run_jobs(jobs, core_budget, io_budget)
 
 
 if __name__ == "__main__":
+    from log_setup import get_logger
+    get_logger()
     # Example usage: Process a single .mov file
     source = '/mnt/data-local/LA-June/Body'
     # recusrsively find all .mov files in the source directory
@@ -0,0 +1,166 @@
+# Content-addressed cache of extracted frames.
+# Outputs are keyed by what produced them - a fingerprint of the source file, the frame
+# index and the encode parameters (format, quality, pix_fmt, rotation, ...) - instead of by
+# path. When a clip is extracted again after folders were reorganised, every frame that was
+# already encoded is hard-linked (or reflinked, or copied as a last resort) into its new
+# place and the extractor skips decoding it.
+
+import os
+import json
+import shutil
+import sqlite3
+import hashlib
+import logging
+import threading
+from fs_utils import temp_path
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DB = os.environ.get('VID_CONVERT_OUTPUT_CACHE', os.path.expanduser('~/.vid_convert/output_cache.sqlite'))
+
+# bytes hashed from the start, middle and end of a source; with the size this identifies a
+# clip without reading tens of GB of ProRes
+SAMPLE_SIZE = 4 << 20
+# linux ioctl for copy-on-write clones (btrfs, xfs with reflink=1)
+FICLONE = 0x40049409
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS sources (
+    path TEXT PRIMARY KEY,
+    size INTEGER,
+    mtime REAL,
+    fingerprint TEXT
+);
+CREATE TABLE IF NOT EXISTS outputs (
+    key TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    size INTEGER,
+    inode INTEGER,
+    device INTEGER,
+    mtime REAL
+);
+'''
+
+
+def source_fingerprint(path, sample_size=SAMPLE_SIZE):
+    """ SHA-1 over the size and three samples of the file. """
+    size = os.path.getsize(path)
+    digest = hashlib.sha1(str(size).encode())
+    with open(path, 'rb') as f:
+        for offset in sorted({0, max(0, size // 2 - sample_size // 2), max(0, size - sample_size)}):
+            f.seek(offset)
+            digest.update(f.read(sample_size))
+    return digest.hexdigest()
+
+
+def file_identity(st):
+    # a file renamed onto a cached path keeps its own inode (and mtime), so size alone is not enough
+    return st.st_size, st.st_ino, st.st_dev, st.st_mtime
+
+
+def output_key(fingerprint, frame_number, params):
+    encoded = json.dumps(params, sort_keys=True)
+    return hashlib.sha1(f'{fingerprint}:{frame_number}:{encoded}'.encode()).hexdigest()
+
+
+def link_or_copy(src, dst):
+    """ Place src at dst as a hard link, else a reflink, else a copy; always through a temp name. """
+    tmp = temp_path(dst)
+    try:
+        try:
+            os.link(src, tmp)
+        except OSError:
+            try:
+                import fcntl
+                with open(src, 'rb') as fsrc, open(tmp, 'wb') as fdst:
+                    fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+            except (OSError, ImportError):
+                shutil.copyfile(src, tmp)
+        os.replace(tmp, dst)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+class OutputCache:
+    """ SQLite map from (source fingerprint, frame, encode params) to an existing output file. """
+
+    def __init__(self, db_path=DEFAULT_DB):
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, timeout=60, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        columns = [row[1] for row in self.conn.execute('PRAGMA table_info(outputs)')]
+        if columns and 'inode' not in columns:
+            # rows from before outputs were identified by inode cannot be validated, start over
+            self.conn.execute('DROP TABLE outputs')
+        self.conn.executescript(SCHEMA)
+
+    def fingerprint(self, source):
+        """ Fingerprint of source, recomputed only when its path, size or mtime changed. """
+        source = os.path.abspath(source)
+        st = os.stat(source)
+        with self.lock:
+            row = self.conn.execute('SELECT size, mtime, fingerprint FROM sources WHERE path = ?', (source,)).fetchone()
+        if row and row[0] == st.st_size and row[1] == st.st_mtime:
+            return row[2]
+        fingerprint = source_fingerprint(source)
+        with self.lock, self.conn:
+            self.conn.execute('INSERT OR REPLACE INTO sources VALUES (?, ?, ?, ?)',
+                              (source, st.st_size, st.st_mtime, fingerprint))
+        return fingerprint
+
+    def lookup(self, fingerprint, frame_number, params):
+        """ Path of a cached output that is still the very file that was stored (size, inode, device, mtime), else None. """
+        key = output_key(fingerprint, frame_number, params)
+        with self.lock:
+            row = self.conn.execute('SELECT path, size, inode, device, mtime FROM outputs WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        try:
+            if file_identity(os.stat(row[0])) == tuple(row[1:]):
+                return row[0]
+        except OSError:
+            pass
+        with self.lock, self.conn:
+            self.conn.execute('DELETE FROM outputs WHERE key = ?', (key,))
+        return None
+
+    def restore(self, fingerprint, frame_number, params, dst):
+        """ Link the cached output for this frame to dst; True on a hit. """
+        cached = self.lookup(fingerprint, frame_number, params)
+        if cached is None:
+            return False
+        if os.path.abspath(cached) != os.path.abspath(dst):
+            try:
+                os.makedirs(os.path.dirname(dst) or '.', exist_ok=True)
+                link_or_copy(cached, dst)
+            except OSError as e:
+                # e.g. the cached file went away after the lookup; the caller produces the frame itself
+                logger.warning(f'Could not restore {cached} to {dst}: {e}')
+                return False
+        return True
+
+    def store(self, fingerprint, outputs, params):
+        """ Record {frame_number: path} outputs written from the source with this fingerprint. """
+        rows = []
+        for frame_number, path in outputs.items():
+            try:
+                rows.append((output_key(fingerprint, frame_number, params), os.path.abspath(path)) + file_identity(os.stat(path)))
+            except OSError:
+                continue
+        with self.lock, self.conn:
+            self.conn.executemany('INSERT OR REPLACE INTO outputs VALUES (?, ?, ?, ?, ?, ?)', rows)
+
+
+_caches = {}
+
+
+def get_cache(db_path=DEFAULT_DB):
+    """ One OutputCache per process and database, sqlite connections must not cross a fork. """
+    key = (os.getpid(), db_path)
+    if key not in _caches:
+        _caches[key] = OutputCache(db_path)
+    return _caches[key]
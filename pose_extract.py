@@ -0,0 +1,92 @@
+# Pose-level synchronized extraction for modeling sets.
+# All camera clips of one pose (model/pose/camera_07-0003.mp4) are read in parallel, one
+# capture per clip, and the requested frame indices are written straight into a flat
+# modeling folder as camera_07_<pose>-<frame>.png, the names get_modeling_frames produces.
+# Requested indices are on the corrected timeline: cameras listed in CAMERA_UPDATE_TABLE
+# read the clip frame that the renumbering maps onto that index.
+
+import os
+import time
+from log_setup import get_logger
+from camera_pairing import parse_camera_id
+from frame_index import list_files
+from batch_frames import extract_frames_batch
+from process_mp4 import pad_frame_number
+from camera_updates import CAMERA_UPDATE_TABLE, pair_ranges
+
+logger = get_logger(__name__, 'pose_extract.log')
+
+
+def camera_offsets(camera_table=CAMERA_UPDATE_TABLE):
+    """ {camera: [(old_start, old_end, offset), ...]} from the update table. """
+    return {camera: [(old[0], old[1], new[0] - old[0]) for old, new in pair_ranges(entry)]
+            for camera, entry in camera_table.items()}
+
+
+def source_frame(frame_number, segments):
+    """ Clip frame that lands on frame_number after renumbering, None if the renumbering left a gap there. """
+    for old_start, old_end, offset in segments:
+        if old_start + offset <= frame_number <= old_end + offset:
+            return frame_number - offset
+    for old_start, old_end, _ in segments:
+        if old_start <= frame_number <= old_end:
+            # this clip frame was moved elsewhere and nothing moved onto it
+            return None
+    return frame_number
+
+
+def pose_clips(pose_dir, ext='.mp4'):
+    """ {camera_number: clip} for the camera clips directly under pose_dir. """
+    clips = {}
+    for clip in list_files(pose_dir, ext):
+        camera = parse_camera_id(clip)
+        if camera is None or os.path.dirname(clip) != os.path.abspath(pose_dir).rstrip('/'):
+            continue
+        if camera in clips:
+            logger.warning(f'Camera {camera} has more than one clip in {pose_dir}, using {clips[camera]}')
+            continue
+        clips[camera] = clip
+    return clips
+
+
+def modeling_frame_name(camera, pose, frame_number, ext='.png'):
+    return f'camera_{camera:02d}_{pose}-{pad_frame_number(frame_number)}{ext}'
+
+
+def extract_pose(pose_dir, frame_numbers, out_dir, cameras=None, apply_offsets=True, ext='.png', workers=None, rotate=True):
+    """ Write frame_numbers of every camera clip of a pose into out_dir, returns the files written. """
+    pose = os.path.basename(os.path.abspath(pose_dir).rstrip('/'))
+    clips = pose_clips(pose_dir)
+    if cameras:
+        clips = {camera: clip for camera, clip in clips.items() if camera in cameras}
+    offsets = camera_offsets() if apply_offsets else {}
+    requests = []
+    for camera, clip in sorted(clips.items()):
+        for frame_number in frame_numbers:
+            clip_frame = source_frame(frame_number, offsets.get(camera, []))
+            if clip_frame is None:
+                logger.warning(f'Camera {camera} has no frame {frame_number} after renumbering, skipped')
+                continue
+            requests.append((clip, clip_frame, os.path.join(out_dir, modeling_frame_name(camera, pose, frame_number, ext))))
+    logger.info(f'Extracting {len(frame_numbers)} frames from {len(clips)} cameras of {pose}')
+    start = time.time()
+    written = extract_frames_batch(requests, rotate=rotate, workers=workers)
+    logger.info(f'Wrote {len(written)} of {len(requests)} frames to {out_dir} in {time.time() - start:.1f} sec')
+    return written
+
+
+if __name__ == '__main__':
+    import argparse
+    from make_frame_list import parse_frame_indices
+    parser = argparse.ArgumentParser(description='Extract synchronized frames from every camera clip of a pose.')
+    parser.add_argument('pose_dir', type=str, help='Folder with the camera_XX-*.mp4 clips of one pose')
+    parser.add_argument('frames', type=str, help="Frame indices on the corrected timeline, e.g. '3' or '0,10,25-40'")
+    parser.add_argument('out_dir', type=str, help='Folder for the modeling set')
+    parser.add_argument('--cameras', type=str, default=None, help="Camera numbers to include, e.g. '1-40,60-63'")
+    parser.add_argument('--no-offsets', action='store_true', help='Ignore CAMERA_UPDATE_TABLE')
+    parser.add_argument('--ext', type=str, default='.png', help='Output format (.png or .avif)')
+    parser.add_argument('--workers', type=int, default=None, help='Clips decoded in parallel')
+    args = parser.parse_args()
+    cameras = set(parse_frame_indices(args.cameras)) if args.cameras else None
+    extract_pose(args.pose_dir, parse_frame_indices(args.frames), args.out_dir, cameras,
+                 not args.no_offsets, args.ext, args.workers)
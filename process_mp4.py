@@ -3,13 +3,30 @@ import os
 from pathlib import Path
 import cv2
 import time
-import logging
+from log_setup import get_logger, ProgressLogger
 import sys
+from frame_index import get_index, list_files
+from frame_record import parse_frame_path
+from batch_frames import extract_video_frames, extract_frames_batch
+from fs_utils import atomic_output
+from ffmpeg_runner import FFmpegRunner
+from frame_dedup import FrameDeduper, link_duplicates
+from frame_writer import FrameWriter, encode_image
+from frame_transform import rotate_pngs
+from frame_buffers import FrameBufferPool, FrameBufferPools
+from output_cache import get_cache
 
-logging.basicConfig(filename='frame_processing.log', level=logging.INFO)
-logger = logging.getLogger(__name__)
-logger.addHandler(logging.FileHandler('frame_processing.log'))
-logger.addHandler(logging.StreamHandler(sys.stdout))
+logger = get_logger(__name__, 'frame_processing.log')
+
+
+def remove_alpha(im):
+    # check for alpha channel and remove if found
+    if im.mode in ('RGBA', 'LA') or (im.mode == 'P' and 'transparency' in im.info):
+        alpha = im.convert('RGBA').split()[-1]
+        bg = Image.new("RGBA", im.size, (255, 255, 255, 255))
+        bg.paste(im, mask=alpha)
+        im = bg
+    return im
 
 
 def convert_png_to_avif(image_in):
@@ -19,18 +36,61 @@ def convert_png_to_avif(image_in):
     # convert image to AVIF format
     if os.path.isfile(image_in):
         logger.debug(f'Converting {image_in} to AVIF')
-    im = Image.open(image_in)
-    # check for alpha channel and remove if found
-    if im.mode in ('RGBA', 'LA') or (im.mode == 'P' and 'transparency' in im.info):
-        alpha = im.convert('RGBA').split()[-1]
-        bg = Image.new("RGBA", im.size, (255, 255, 255, 255))
-        bg.paste(im, mask=alpha)
-        im = bg
+    im = remove_alpha(Image.open(image_in))
     im.save(image_in.replace('.png', '.avif'), 'AVIF', quality_mode='q', quality_level=100)
     # remove the PNG file
     os.remove(image_in)
 
 
+def convert_png_to_avif_verified(image_in, threads=1):
+    # encode to a temp file, rename it into place, and only delete the PNG once the AVIF
+    # reads back with the same dimensions. returns (png_bytes, avif_bytes)
+    avif_name = image_in.replace('.png', '.avif')
+    png_size = os.path.getsize(image_in)
+    with Image.open(image_in) as source:
+        im = remove_alpha(source)
+        with atomic_output(avif_name) as tmp:
+            im.save(tmp, 'AVIF', quality_mode='q', quality_level=100, max_threads=threads)
+            with Image.open(tmp) as check:
+                check.load()
+                if check.size != im.size:
+                    raise ValueError(f'AVIF size {check.size} does not match PNG size {im.size}')
+    os.remove(image_in)
+    return png_size, os.path.getsize(avif_name)
+
+
+def bulk_convert_png_to_avif(files, workers=None, threads=2, report_interval=10.0):
+    # convert many PNGs in a process pool, each encoder using a few threads so the
+    # whole machine is busy without oversubscribing it
+    import concurrent.futures
+    workers = workers or max(1, os.cpu_count() // threads)
+    start = time.time()
+    progress = ProgressLogger(logger, 'PNG to AVIF', len(files), report_interval, unit='files')
+    done = failed = png_bytes = avif_bytes = 0
+    converted = []
+    logger.info(f'Converting {len(files)} PNG files with {workers} workers x {threads} encoder threads')
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(convert_png_to_avif_verified, file, threads): file for file in files}
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                png_size, avif_size = future.result()
+                done += 1
+                png_bytes += png_size
+                avif_bytes += avif_size
+                converted.append(futures[future])
+            except BaseException as e:
+                failed += 1
+                logger.error(f'Error converting {futures[future]} to AVIF:\n\t{e}')
+            progress.update()
+    index = get_index()
+    index.forget(converted)
+    index.record([file.replace('.png', '.avif') for file in converted])
+    elapsed = time.time() - start
+    logger.info(f'Converted {done} PNG files ({failed} failed) in {elapsed:.2f} sec, '
+                f'{done / max(elapsed, 1e-6):.2f} files/sec, {png_bytes / 1e6:.1f} MB -> {avif_bytes / 1e6:.1f} MB')
+    return converted
+
+
 def pad_frame_number(count, pad_length=5):
     #given an integer, pad it with zeros to make it pad length long
     # return as string
@@ -40,8 +100,27 @@ def pad_frame_number(count, pad_length=5):
     return count_str
 
 
-def export_mp4_to_frames(mp4_path, src='/mnt/data/datasets/LA-round2-all/selects/', dst='/mnt/data/datasets/LA-round2-frames/'):
+def read_uncached(vidcap, buffers, frame_number, name_for, cache, fingerprint, params, linked, progress):
+    # frames already encoded from this source (output cache hit) are linked to name_for(frame)
+    # and stepped over with grab(), without decoding; returns (frame_number, success, image)
+    # for the next frame that has to be decoded
+    # a frame is only skipped once its output is in place; if the link fails it is decoded
+    while cache is not None:
+        out_name = name_for(frame_number)
+        if not cache.restore(fingerprint, frame_number, params, out_name):
+            break
+        linked.append(out_name)
+        frame_number += 1
+        progress.update()
+        if not vidcap.grab():
+            return frame_number, False, None
+    success, image = buffers.read(vidcap)
+    return frame_number, success, image
+
+
+def export_mp4_to_frames(mp4_path, src='/mnt/data/datasets/LA-round2-all/selects/', dst='/mnt/data/datasets/LA-round2-frames/', dedup=None, writers=4, exif_orientation=False, use_cache=True, buffers=None):
     # load the mp4 file, output whole frames rotated 90 degrees clockwise
+    # (or, with exif_orientation, unrotated PNGs tagged with EXIF orientation 6)
     # frames will be AVIF format
     # mp4_path = mp4_path.replace(src, dst)
     frames_path = os.path.dirname(mp4_path.replace(src, dst))
@@ -52,33 +131,53 @@ def export_mp4_to_frames(mp4_path, src='/mnt/data/datasets/LA-round2-all/selects
     if not os.path.exists(frames_path) and os.path.exists(mp4_path):
         os.makedirs(frames_path)
     vidcap = cv2.VideoCapture(mp4_path)
-    success, image = vidcap.read()
-    count = 0
-    camera = mp4_path.split('/')[-1].split('-')[0]
-    pose = mp4_path.split('/')[-2]
-    model = mp4_path.split('/')[-3]
+    # PNG encoding and the write to the output mount happen on writer threads, off the decode loop;
+    # frames are decoded into pooled buffers that the writer hands back once the file is written.
+    # buffers: FrameBufferPools shared with concurrent calls, by default a pool of this call's own
+    writer = FrameWriter(workers=writers)
+    buffers = buffers.for_capture(vidcap) if buffers else FrameBufferPool.for_capture(vidcap, writer.max_pending + 2)
+    record = parse_frame_path(mp4_path)
+    camera, pose, model = record.camera, record.pose, record.model
     frames_path = f'{frames_path}/{camera}'
     if not os.path.exists(frames_path):
         os.makedirs(frames_path)
     logger.info(f'Extracting frames from {mp4_path}')
+    refs = []
+    # dedup: None, or a FrameDeduper threshold; near-identical frames are recorded as refs instead of written
+    deduper = FrameDeduper(dedup) if dedup is not None else None
+    progress = ProgressLogger(logger, f'{model} {pose} {camera}', int(vidcap.get(cv2.CAP_PROP_FRAME_COUNT)) or None)
+    cache = get_cache() if use_cache else None
+    fingerprint = cache.fingerprint(mp4_path) if cache else None
+    params = {'format': '.png', 'rotate': 90, 'exif_orientation': exif_orientation}
+    linked = []
+    count, success, image = read_uncached(vidcap, buffers, 0, lambda n: f'{frames_path}/{pose}-{pad_frame_number(n)}.png',
+                                          cache, fingerprint, params, linked, progress)
     while success:
         # logger.info(f'\tRead Succeeded! Processing...')
         try:
             out_name = f'{frames_path}/{pose}-{pad_frame_number(count)}.png'
             # avif_name = f'{frames_path}/{pose}-{pad_frame_number(count)}.avif'
-            image = cv2.rotate(image, cv2.ROTATE_90_CLOCKWISE)
             # validate the image is not empty
             if image is None or image.size == 0:
                 logger.error(f'Empty image at frame {count} from {mp4_path}')
-                success, image = vidcap.read()
-                count += 1
+                buffers.release(image)
+                count, success, image = read_uncached(vidcap, buffers, count + 1, lambda n: f'{frames_path}/{pose}-{pad_frame_number(n)}.png',
+                                                      cache, fingerprint, params, linked, progress)
                 continue
             # logger.info(f'\tAttempting to write {out_name}')
+            ref = deduper.reference(image, out_name) if deduper else None
+            if ref is not None:
+                refs.append((out_name, ref))
+                buffers.release(image)
+                count, success, image = read_uncached(vidcap, buffers, count + 1, lambda n: f'{frames_path}/{pose}-{pad_frame_number(n)}.png',
+                                                      cache, fingerprint, params, linked, progress)
+                progress.update()
+                continue
 
             logger.debug(f'Writing {out_name}')
-
-            cv2.imwrite(out_name, image)
-            logger.debug(f'Extracted {out_name}, exists: {os.path.exists(out_name)}')
+            # rotation happens on the writer thread, into that thread's reused buffer
+            write = writer.submit_image(out_name, image, rotate=90, exif_orientation=exif_orientation)
+            write.add_done_callback(lambda _, buffer=image: buffers.release(buffer))
             # logger.debug("generating AVIF")
             # convert_png_to_avif(out_name)
             # logger.debug(f'Created {avif_name}, exists: {os.path.exists(avif_name)}')
@@ -86,33 +185,152 @@ def export_mp4_to_frames(mp4_path, src='/mnt/data/datasets/LA-round2-all/selects
         except BaseException as e:
             logger.error(f'Error processing frame {count} from {mp4_path}:\n\t{e}')
 
-        success, image = vidcap.read()
-        logger.info(f'Processing success:{success} from {mp4_path} to {frames_path}')
-        count += 1
+        progress.update()
+        count, success, image = read_uncached(vidcap, buffers, count + 1, lambda n: f'{frames_path}/{pose}-{pad_frame_number(n)}.png',
+                                              cache, fingerprint, params, linked, progress)
         # logger.debug(f'\tInner Loop Count: {count}, Out_name: {avif_name}')
+    writer.close()
+    vidcap.release()
+    progress.done()
+    get_index().record(writer.written + linked)
+    if cache:
+        cache.store(fingerprint, {parse_frame_path(path).frame: path for path in writer.written}, params)
+        if linked:
+            logger.info(f'Linked {len(linked)} cached frames of {model} {pose} {camera}')
+    if refs:
+        # kept frames are written by now, link them to the skipped names
+        get_index().record(link_duplicates(refs))
+        get_index().record_refs(refs)
+        logger.info(f'Linked {len(refs)} duplicate frames of {model} {pose} {camera}')
+    logger.info(f'Wrote {len(writer.written)} of {count} frames from {model} {pose} {camera} to:\n{frames_path}')
+
+
+def encode_frame_to_avif(image, rotate=True):
+    # worker side of the pipeline: rotate a raw BGR frame and encode it straight to AVIF bytes,
+    # no intermediate PNG is written and the parent's writer threads do the file I/O
+    return encode_image(image, '.avif', 90 if rotate else 0)
+
+
+def export_mp4_to_avif_pipelined(mp4_path, executor, writer, src='/mnt/data/datasets/LA-round2-all/selects/', dst='/mnt/data/datasets/LA-round2-frames/', dedup=None, use_cache=True, buffers=None):
+    # decoder side of the pipeline: read frames and hand them to the encoder pool
+    # writer is a FrameWriter shared by all decoders, its max_pending caps the raw frames held in memory
+    frames_path = os.path.dirname(mp4_path.replace(src, dst))
+    if not os.path.exists(mp4_path):
+        logger.error(f'Source not found: {mp4_path}')
+        return 0
+    record = parse_frame_path(mp4_path)
+    camera, pose, model = record.camera, record.pose, record.model
+    frames_path = f'{frames_path}/{camera}'
+    os.makedirs(frames_path, exist_ok=True)
+    logger.info(f'Extracting frames from {mp4_path}')
+
+    vidcap = cv2.VideoCapture(mp4_path)
+    # a buffer goes back to the pool once its frame is encoded and written. buffers: the
+    # FrameBufferPools shared by all decoders of the writer; a lone decoder gets one more
+    # buffer than the writer's bound so it can read ahead while the writer is full
+    buffers = buffers.for_capture(vidcap) if buffers else FrameBufferPool.for_capture(vidcap, writer.max_pending + 1)
+    progress = ProgressLogger(logger, f'{model} {pose} {camera} decode', int(vidcap.get(cv2.CAP_PROP_FRAME_COUNT)) or None)
+    futures = []
+    refs = []
+    # duplicate checks run on the decoder thread so skipped frames never reach the encoder pool
+    deduper = FrameDeduper(dedup) if dedup is not None else None
+    cache = get_cache() if use_cache else None
+    fingerprint = cache.fingerprint(mp4_path) if cache else None
+    params = {'format': '.avif', 'quality': 100, 'rotate': 90}
+    linked = []
+    count, success, image = read_uncached(vidcap, buffers, 0, lambda n: f'{frames_path}/{pose}-{pad_frame_number(n)}.avif',
+                                          cache, fingerprint, params, linked, progress)
+    while success:
+        if image is None or image.size == 0:
+            logger.error(f'Empty image at frame {count} from {mp4_path}')
+        else:
+            avif_name = f'{frames_path}/{pose}-{pad_frame_number(count)}.avif'
+            ref = deduper.reference(image, avif_name) if deduper else None
+            if ref is not None:
+                refs.append((avif_name, ref))
+                buffers.release(image)
+                progress.update()
+                count, success, image = read_uncached(vidcap, buffers, count + 1, lambda n: f'{frames_path}/{pose}-{pad_frame_number(n)}.avif',
+                                                      cache, fingerprint, params, linked, progress)
+                continue
+            write = writer.submit(avif_name, executor.submit(encode_frame_to_avif, image))
+            write.add_done_callback(lambda _, buffer=image: buffers.release(buffer))
+            futures.append((count, write))
+        progress.update()
+        count, success, image = read_uncached(vidcap, buffers, count + 1, lambda n: f'{frames_path}/{pose}-{pad_frame_number(n)}.avif',
+                                              cache, fingerprint, params, linked, progress)
+    vidcap.release()
+    progress.done()
+
+    written = {}
+    for frame_count, future in futures:
+        try:
+            written[frame_count] = future.result()
+        except BaseException as e:
+            logger.error(f'Error processing frame {frame_count} from {mp4_path}:\n\t{e}')
+    get_index().record(list(written.values()) + linked)
+    if cache:
+        cache.store(fingerprint, written, params)
+        if linked:
+            logger.info(f'Linked {len(linked)} cached frames of {model} {pose} {camera}')
+    if refs:
+        # kept frames are written by now, link them to the skipped names
+        get_index().record(link_duplicates(refs))
+        get_index().record_refs(refs)
+        logger.info(f'Linked {len(refs)} duplicate frames of {model} {pose} {camera}')
     logger.info(f'Wrote {count} frames from {model} {pose} {camera} to:\n{frames_path}')
+    return count
 
 
-def export_prores_to_frames(prores_path, src='/mnt/data/datasets/LA-round2-all/selects/', dst='/mnt/data/datasets/LA-round2-frames/', rotate=False):
-    # using ffmpeg to extract frames from a ProRes file and write them to a folder
+def pipelined_video_processor(vid_list, workers=None, queue_size=None, src='/mnt/data/datasets/LA-round2-all/selects/', dst='/mnt/data/datasets/LA-round2-frames/', dedup=None, use_cache=True):
+    # one decoder thread per video feeds a shared process pool that rotates and encodes
+    import concurrent.futures
+    workers = workers or os.cpu_count()
+    queue_size = queue_size or workers * 2
+    # one writer thread per queued frame, each waits for its encode and then writes the file
+    with FrameWriter(workers=queue_size, max_pending=queue_size) as writer:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            # every decoder holds an open decoder context and a decoded frame while it waits on the
+            # writer, so their number is capped as well instead of opening every clip at once
+            decoder_count = max(1, min(len(vid_list), workers))
+            # one buffer pool for all decoders, so raw frames in memory stay within the writer's
+            # bound plus the frame each decoder is working on
+            buffers = FrameBufferPools(writer.max_pending + decoder_count)
+            with concurrent.futures.ThreadPoolExecutor(max_workers=decoder_count) as decoders:
+                counts = decoders.map(lambda vid: export_mp4_to_avif_pipelined(vid, executor, writer, src, dst, dedup, use_cache, buffers), vid_list)
+                return sum(counts)
+
+
+def prores_frames_job(prores_path, runner, src='/mnt/data/datasets/LA-round2-all/selects/', dst='/mnt/data/datasets/LA-round2-frames/', rotate=False):
+    # (name, cmd) ffmpeg job extracting the frames of a ProRes file to a folder, None if the source is missing
     frames_path = os.path.dirname(prores_path.replace(src, dst))
     if not os.path.exists(prores_path):
         logger.error(f'Source not found: {prores_path}')
-        return
-    if not os.path.exists(frames_path) and os.path.exists(prores_path):
-        os.makedirs(frames_path)
-    # use ffmpeg to extract frames
-    # frame output_name formatting: {frames_path}/{pose}-{pad_frame_number(count)}.png
+        return None
+    # frame output_name formatting: {frames_path}/{base_name}/{base_name}_%04d.png
     base_name = os.path.basename(prores_path).split('.')[0]
     folder_name = f'{frames_path}/{base_name}'
-    if not os.path.exists(folder_name):
-        os.makedirs(folder_name)
-    if rotate:
-        command = f'ffmpeg -i "{prores_path}" -vf "transpose=1" -q:v 2 "{frames_path}/{base_name}/{base_name}_%04d.png"'
-    else:
-        command = f'ffmpeg -i "{prores_path}" -q:v 2 "{frames_path}/{base_name}/{base_name}_%04d.png"'
-    logger.info(f'Extracting frames from {prores_path} to {frames_path}')
-    os.system(command)
+    os.makedirs(folder_name, exist_ok=True)
+    output_args = ['-vf', 'transpose=1'] if rotate else []
+    output_args += ['-q:v', '2']
+    return base_name, runner.command(prores_path, f'{folder_name}/{base_name}_%04d.png', output_args)
+
+
+def export_prores_to_frames(prores_path, src='/mnt/data/datasets/LA-round2-all/selects/', dst='/mnt/data/datasets/LA-round2-frames/', rotate=False, threads=4):
+    # using ffmpeg to extract frames from a ProRes file and write them to a folder
+    runner = FFmpegRunner(max_jobs=1, threads_per_job=threads)
+    job = prores_frames_job(prores_path, runner, src, dst, rotate)
+    if job is None:
+        return None
+    logger.info(f'Extracting frames from {prores_path}')
+    return runner.run([job])[0]
+
+
+def export_prores_folder(prores_files, src='/mnt/data/datasets/LA-round2-all/selects/', dst='/mnt/data/datasets/LA-round2-frames/', rotate=False, max_jobs=None, threads=4):
+    # many ProRes files at once, max_jobs x threads sized to the core count unless given
+    runner = FFmpegRunner(max_jobs=max_jobs, threads_per_job=threads)
+    jobs = [job for job in (prores_frames_job(path, runner, src, dst, rotate) for path in prores_files) if job]
+    return runner.run(jobs)
 
 
 # def get_all_mp4s(folder):
@@ -128,38 +346,33 @@ def export_prores_to_frames(prores_path, src='/mnt/data/datasets/LA-round2-all/s
 
 
 
-def rotate_images(input_folder, output_folder, angle):
-    if not os.path.exists(output_folder):
-        os.makedirs(output_folder)
-    for filename in os.listdir(input_folder):
-        if filename.endswith(".png"):
-            img_path = os.path.join(input_folder, filename)
-            img = Image.open(img_path)
-            rotated_img = img.rotate(angle, expand=True)
-            rotated_img.save(os.path.join(output_folder, filename))
+def rotate_images(input_folder, output_folder, angle, workers=None):
+    # angle is counter-clockwise like PIL's Image.rotate; the PNGs are copied with an EXIF
+    # orientation instead of being decoded, rotated and re-encoded
+    files = sorted(os.path.join(input_folder, f) for f in os.listdir(input_folder) if f.endswith('.png'))
+    return rotate_pngs(files, output_folder, -angle % 360, workers)
 
 
 def find_png_files(folder):
-    # recursively find png files()
-    png_files = []
-    for root, dirs, files in os.walk(folder):
-        for file in files:
-            if file.endswith(".png"):
-                png_files.append(os.path.join(root, file))
-    return png_files
+    # recursively find png files, served from the frame index
+    return list_files(folder, '.png')
 
 
 def cleanup_png_files(folder='/mnt/data/datasets/LA-data-frames/'):
     # recursively find png files and convert them
     files = find_png_files(folder)
-    _ = [convert_png_to_avif(file) for file in files]
+    bulk_convert_png_to_avif(files)
 
 
 def multithreaded_video_processor(vid_list):
     # multithreaded processing
     import concurrent.futures
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        executor.map(export_mp4_to_frames, vid_list)
+    workers = min(32, os.cpu_count() + 4)
+    # every call has its own writer (4 threads, 16 pending frames); the shared pools cap the raw
+    # frames of all of them together at one writer's worth plus one per decoder
+    buffers = FrameBufferPools(16 + workers)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        executor.map(lambda vid: export_mp4_to_frames(vid, buffers=buffers), vid_list)
 
 # def gather_vid_files(project_root = '/mnt/data/datasets/LA-data/', extension='.mp4'):
 #     pose_sources = []
@@ -185,35 +398,25 @@ def multithreaded_video_processor(vid_list):
     # model = mp4_path.split('/')[-3]
 
 
-def process_single_frame(input_file, frame_number):
-    # Open the video file
-    video = cv2.VideoCapture(input_file)
-
+def single_frame_output(input_file, frame_number):
     # derive file output path from input file
-    camera = input_file.split('/')[-1].split('-')[0]
-    pose = input_file.split('/')[-2]
-    model = input_file.split('/')[-3]
+    pose = parse_frame_path(input_file).pose
     count = pad_frame_number(frame_number)
     frames_path = os.path.dirname(input_file.replace('/LA-data/', '/LA-data-frames/'))
-    output_file = f'{frames_path}/{pose}-{pad_frame_number(count)}.png'
-    avif_name = f'{frames_path}/{pose}-{pad_frame_number(count)}.avif'
-    # Set the frame position
-    video.set(cv2.CAP_PROP_POS_FRAMES, frame_number)
-
-    # Read the specific frame
-    success, frame = video.read()
-    if not success:
-        print("Failed to retrieve the frame.")
-        return
+    return f'{frames_path}/{pose}-{pad_frame_number(count)}.png'
 
-    # Rotate the frame 90 degrees clockwise
-    rotated_frame = cv2.rotate(frame, cv2.ROTATE_90_CLOCKWISE)
 
-    # Save the frame as a PNG image using cv2
-    cv2.imwrite(output_file, rotated_frame)
+def process_single_frame(input_file, frame_number):
+    # Read one frame, rotate it 90 degrees clockwise and save it as a PNG image using cv2
+    output_file = single_frame_output(input_file, frame_number)
+    if not extract_video_frames(input_file, [(frame_number, [output_file])]):
+        print("Failed to retrieve the frame.")
 
-    # Release video capture
-    video.release()
+
+def process_frames_batch(frame_requests, workers=None):
+    # many (input_file, frame_number) pairs, one capture per video and videos in parallel
+    return extract_frames_batch([(input_file, frame_number, single_frame_output(input_file, frame_number))
+                                 for input_file, frame_number in frame_requests], workers=workers)
 
 def get_mp4_from_png_path(png_path):
     # given a path to a PNG file, derive the corresponding MP4 file
@@ -222,7 +425,11 @@ def get_mp4_from_png_path(png_path):
     '''/mnt/data/datasets/LA-data/Model1/EXP_jaw003/camera_50-0014.mp4 << GOOD PATH'''
     '''/mnt/data/datasets/LA-data/EXP_jaw003/camera_69/EXP_jaw003.mp4 << BAD PATH'''
     base_path = str(os.path.dirname(png_path).replace('/LA-data-frames/', '/LA-data/'))
-    camera = os.path.basename(png_path).split('-')[0]
+    record = parse_frame_path(png_path)
+    camera = record.camera
+    if camera is None:
+        logger.error(f'No camera in {png_path}')
+        return None
     # search for mp4 files in base_path that start with camera
     mp4_base_path = None
     for root, dirs, files in os.walk(base_path):
@@ -231,8 +438,7 @@ def get_mp4_from_png_path(png_path):
                 mp4_base_path = os.path.join(root, file)
     if not mp4_base_path:
         # exception for Model1 (target: /mnt/data/datasets/LA-data/Model1/EXP_jaw003)
-        pose = os.path.basename(png_path).split('-')[0]
-        camera = os.path.dirname(png_path).split('/')[-1]
+        pose = record.stem
         base_path = base_path.replace(f'/{camera}', "")
         print(camera, pose)
         print(f'exists: {os.path.exists(base_path)}')
@@ -250,54 +456,48 @@ def get_mp4_from_png_path(png_path):
 
 def get_all_pngs(folder):
     """Recursively get all PNG files from the given folder."""
-    png_files = []
-    for root, dirs, files in os.walk(folder):
-        for file in files:
-            if file.endswith('.png'):
-                png_files.append(os.path.join(root, file))
-    return png_files
+    return list_files(folder, '.png')
+
+
+def get_all_avifs(folder):
+    """Recursively get all AVIF files from the given folder."""
+    return list_files(folder, '.avif')
+
+
+def get_all_mp4s(folder):
+    """Recursively get all MP4 files from the given folder."""
+    return list_files(folder, '.mp4')
 
 
 def cleaning_png_files(folder='/mnt/data/datasets/LA-data-frames/'):
     # recursively find png files and convert them
     files = find_png_files(folder)
-    _ = [convert_png_to_avif(file) for file in files]
+    bulk_convert_png_to_avif(files)
 
 
-def mov_extract_frame(input_file, pose_name, model_name, frame_number):
-    # Open the video file
-    video = cv2.VideoCapture(input_file)
-
+def mov_extract_output(input_file, pose_name, frame_number):
     # derive file output path from input file
-    camera_number = input_file.split('/')[-1].split('-')[0]
-    pose = pose_name
-    model = model_name
     count = pad_frame_number(frame_number)
     frames_path = os.path.dirname(input_file.replace('/LA-round2/', '/LA-round2-frames/'))
-    output_file = f'{frames_path}/{pose}-{pad_frame_number(count)}.png'
-    avif_name = f'{frames_path}/{pose}-{pad_frame_number(count)}.avif'
-    # Set the frame position
-    video.set(cv2.CAP_PROP_POS_FRAMES, frame_number)
-
-    # Read the specific frame
-    success, frame = video.read()
-    if not success:
-        print("Failed to retrieve the frame.")
-        return
+    return f'{frames_path}/{pose_name}-{pad_frame_number(count)}.png'
 
-    # Rotate the frame 90 degrees clockwise
-    rotated_frame = cv2.rotate(frame, cv2.ROTATE_90_CLOCKWISE)
 
-    # Save the frame as a PNG image using cv2
-    cv2.imwrite(output_file, rotated_frame)
-
-    # Release video capture
-    video.release()
+def mov_extract_frame(input_file, pose_name, model_name, frame_number):
+    # Read one frame, rotate it 90 degrees clockwise and save it as a PNG image using cv2
+    output_file = mov_extract_output(input_file, pose_name, frame_number)
+    if not extract_video_frames(input_file, [(frame_number, [output_file])]):
+        print("Failed to retrieve the frame.")
 
     # convert the PNG to AVIF
     #convert_png_to_avif(output_file)
 
 
+def mov_extract_frames_batch(frame_requests, workers=None):
+    # many (input_file, pose_name, model_name, frame_number) tuples served from one capture per video
+    return extract_frames_batch([(input_file, frame_number, mov_extract_output(input_file, pose_name, frame_number))
+                                 for input_file, pose_name, _, frame_number in frame_requests], workers=workers)
+
+
 '''
     print('Multiprocessing Video Captures')
     start = time.time()
@@ -346,12 +546,25 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Process MP4 files to extract frames.')
     parser.add_argument('input_folder', type=str, help='Path to the input folder containing MP4 files.')
     parser.add_argument('--rotate', action='store_true', help='Rotate frames 90 degrees clockwise.')
+    parser.add_argument('--mp4', action='store_true', help='Extract AVIF frames from MP4 files with the pipelined decoder/encoder.')
+    parser.add_argument('--dst', type=str, default='/mnt/data/datasets/LA-round2-frames/', help='Output root for --mp4 frames.')
+    parser.add_argument('--dedup', type=float, default=None, help='Skip --mp4 frames within this mean pixel difference of the last kept frame.')
+    parser.add_argument('--no-cache', action='store_true', help='Decode every --mp4 frame instead of linking frames already in the output cache.')
+    parser.add_argument('--jobs', type=int, default=None, help='ffmpeg processes at once (default: cores / threads).')
+    parser.add_argument('--threads', type=int, default=4, help='ffmpeg threads per MOV file.')
     args = parser.parse_args()
     input_folder = args.input_folder
     rotate = args.rotate
     if not os.path.exists(input_folder):
         logger.error(f'Input folder does not exist: {input_folder}')
         sys.exit(1)
+    if args.mp4:
+        mp4_files = sorted(os.path.join(root, file) for root, _, files in os.walk(input_folder) for file in files if file.endswith('.mp4'))
+        logger.info(f'Found {len(mp4_files)} MP4 files in {input_folder}')
+        start = time.time()
+        total = pipelined_video_processor(mp4_files, src=input_folder, dst=args.dst, dedup=args.dedup, use_cache=not args.no_cache)
+        logger.info(f'Wrote {total} frames in {time.time() - start:.2f} seconds')
+        sys.exit(0)
     # gather all MOV files in the input folder
     mov_files = [os.path.join(root, file) for root, _, files in os.walk(input_folder) for file in files if file.endswith('.mov')]
     if not mov_files:
@@ -359,6 +572,6 @@ if __name__ == '__main__':
         sys.exit(1)
     logger.info(f'Found {len(mov_files)} MOV files in {input_folder}')
     # process MOV files
-    import concurrent.futures
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        executor.map(export_prores_to_frames, mov_files)
\ No newline at end of file
+    results = export_prores_folder(mov_files, rotate=rotate, max_jobs=args.jobs, threads=args.threads)
+    if not all(result.ok for result in results):
+        sys.exit(1)
\ No newline at end of file
@@ -1,4 +1,5 @@
 import os
+from camera_pairing import parse_camera_id, pair_views, export_pairs
 # given the following names:
 cal_data_name = '001-RX0_9990253_C0008.04030868'
 max_data_name = 'camera_01_M4_EXP_eye_neutral-00003'
@@ -6,10 +7,10 @@ max_data_name = 'camera_01_M4_EXP_eye_neutral-00003'
 # 001 corresponsds to camera_01
 # for a pair of lists of names, find the matching views
 def find_matching_views(cal_data_name, max_data_name):
-    cal_camera_number = int(cal_data_name.split('-')[0])
-    max_camera_number = int(max_data_name.split('_')[1])
+    cal_camera_number = parse_camera_id(cal_data_name)
+    max_camera_number = parse_camera_id(max_data_name)
 
-    if cal_camera_number == max_camera_number:
+    if cal_camera_number is not None and cal_camera_number == max_camera_number:
         return True
     return False
 
@@ -47,17 +48,9 @@ if __name__ == '__main__':
     cal_data_names = [f for f in os.listdir(cal_data_src) if f.endswith('.png')]
     max_data_names = [f for f in os.listdir(max_data_src) if f.endswith('.png')]
 
-    # generate pairs of names
-    matching_views = []
-    removals = []
-    for cal_name in cal_data_names:
-        for max_name in max_data_names:
-            if find_matching_views(cal_name, max_name):
-                matching_views.append((cal_name, max_name))
-
-    for cal_data_name in cal_data_names:
-        if cal_data_name not in [pair[0] for pair in matching_views]:
-            removals.append(cal_data_name)
+    # generate pairs of names, joined on camera number in one pass
+    matching_views, removals, unmatched_max = pair_views(cal_data_names, max_data_names)
+    export_pairs(matching_views, removals, unmatched_max, 'matching_views.csv')
 
     cam_list = [cams[1].split('_M4_')[0] for cams in matching_views]
     cam_list.sort()
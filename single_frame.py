@@ -1,28 +1,17 @@
 import os
-import cv2
+import sys
+from batch_frames import extract_video_frames, extract_frames_batch, read_request_csv
 
 
 def process_frame(input_file, frame_number, output_file):
-    # Open the video file
-    video = cv2.VideoCapture(input_file)
-
-    # Set the frame position
-    video.set(cv2.CAP_PROP_POS_FRAMES, frame_number)
-
-    # Read the specific frame
-    success, frame = video.read()
-    if not success:
+    # Read one frame, rotate it 90 degrees clockwise and save it as a PNG image using cv2
+    if not extract_video_frames(input_file, [(frame_number, [output_file])]):
         print("Failed to retrieve the frame.")
-        return
 
-    # Rotate the frame 90 degrees clockwise
-    rotated_frame = cv2.rotate(frame, cv2.ROTATE_90_CLOCKWISE)
 
-    # Save the frame as a PNG image using cv2
-    cv2.imwrite(output_file, rotated_frame)
-
-    # Release video capture
-    video.release()
+def process_frames(frame_requests, workers=None):
+    # many (input_file, frame_number, output_file) requests, grouped so each video is opened once
+    return extract_frames_batch(frame_requests, workers=workers)
 
 
 if __name__ == '__main__':
@@ -39,6 +28,11 @@ if __name__ == '__main__':
     /mnt/data/datasets/LA-data-frames/Model1/EXP_jaw003/camera_69/EXP_jaw003-00272.png
         
     '''
+    # re-extract a whole straggler list at once: single_frame.py requests.csv (video,frame,output rows)
+    if len(sys.argv) > 1:
+        process_frames(read_request_csv(sys.argv[1]))
+        sys.exit(0)
+
     # Example usage:
     input_mp4 = "/Users/spooky/Downloads/LA-data/Model1/EXP_eye_neutral/camera_07-0003.mp4"  # Replace with your input MP4 file path
     frame_to_extract = 256 #replace with the frame number you want to extract
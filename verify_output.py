@@ -4,36 +4,43 @@
 
 import os
 import sys
-import logging
-import cv2
-from process_mp4 import convert_png_to_avif, get_all_pngs, get_all_avifs
+import re
+import json
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from log_setup import get_logger
+from process_mp4 import bulk_convert_png_to_avif, get_all_pngs, get_all_avifs, get_mp4_from_png_path
+from batch_frames import extract_video_frames, extract_frames_batch
+from count_frames import get_frame_count
+from avif_header import read_avif_header
+from frame_record import parse_frame_path
+from checkpoint_journal import CheckpointJournal
+from fs_utils import atomic_write_bytes
 
 # Set up logging
-logging.basicConfig(filename='verify_output.log', level=logging.INFO)
-logger = logging.getLogger(__name__)
-logger.addHandler(logging.FileHandler('verify_output.log'))
-logger.addHandler(logging.StreamHandler(sys.stdout))
+logger = get_logger(__name__, 'verify_output.log')
+
+# integrity results are cached per (path, size, mtime) so nightly re-verification only opens changed files
+VERIFY_CACHE = os.environ.get('VID_CONVERT_VERIFY_CACHE', os.path.expanduser('~/.vid_convert/verify_cache.json'))
+FRAME_SUFFIX = re.compile(r'[-_]\d+\.\w+$')
 
 
 def seek_frame_and_convert(mp4_file, frame_number):
     """Seek to a specific frame in the mp4 file and convert it to PNG."""
-    if not os.path.exists(mp4_file):
-        logger.error(f'MP4 file not found: {mp4_file}')
-        return
-
-    vidcap = cv2.VideoCapture(mp4_file)
-    vidcap.set(cv2.CAP_PROP_POS_FRAMES, frame_number)
-    success, image = vidcap.read()
-    if not success:
+    png_path = mp4_file.replace('.mp4', f'-{frame_number}.png')
+    if not extract_video_frames(mp4_file, [(frame_number, [png_path])], rotate=False):
         logger.error(f'Failed to read frame {frame_number} from {mp4_file}')
         return
-
-    # Save the frame as PNG
-    png_path = mp4_file.replace('.mp4', f'-{frame_number}.png')
-    cv2.imwrite(png_path, image)
     logger.info(f'Saved frame {frame_number} from {mp4_file} as {png_path}')
 
 
+def seek_frames_and_convert(frame_requests, workers=None):
+    """Convert many (mp4_file, frame_number) pairs to PNG, opening each mp4 once."""
+    return extract_frames_batch([(mp4_file, frame_number, mp4_file.replace('.mp4', f'-{frame_number}.png'))
+                                 for mp4_file, frame_number in frame_requests], rotate=False, workers=workers)
+
+
 # compare if mp4_path from LA-data has corresponding frames in LA-data-frames
 
 def verify_frames(mp4_path):
@@ -43,9 +50,8 @@ def verify_frames(mp4_path):
         logger.error(f'Frames path not found: {frames_path}')
         return False
 
-    camera = mp4_path.split('/')[-1].split('-')[0]
-    pose = mp4_path.split('/')[-2]
-    model = mp4_path.split('/')[-3]
+    record = parse_frame_path(mp4_path)
+    camera, pose, model = record.camera, record.pose, record.model
 
     # Check for PNG files
     png_files = get_all_pngs(os.path.join(frames_path, camera))
@@ -70,10 +76,121 @@ def verify_frames(mp4_path):
     logger.info(f'All frames verified for {mp4_path}')
     return True
 
+
+def check_avif(avif_path, full_decode=False):
+    """Header check (and optional full decode) of one AVIF, returns a result dict for the report."""
+    result = {'path': avif_path, 'ok': True, 'width': None, 'height': None, 'error': None, 'full_decode': full_decode}
+    try:
+        result['width'], result['height'] = read_avif_header(avif_path)
+        if full_decode:
+            from PIL import Image
+            with Image.open(avif_path) as im:
+                im.load()
+                if im.size != (result['width'], result['height']):
+                    raise ValueError(f'decoded size {im.size} does not match header')
+    except BaseException as e:
+        result['ok'] = False
+        result['error'] = str(e)
+    return result
+
+
+def load_verify_cache():
+    try:
+        with open(VERIFY_CACHE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def expected_frame_count(sequence_dir, basename, frame_path=None):
+    """Source frame count of a sequence, None if unknown.
+
+    Streaming extractor outputs carry it in their checkpoint journal; MP4-derived sequences
+    (the LA-data-frames layout) are counted from the source clip found by get_mp4_from_png_path.
+    """
+    journal = CheckpointJournal(sequence_dir, basename)
+    if journal.frame_count is not None:
+        return journal.frame_count
+    source = journal.source
+    if not source and frame_path and '/LA-data-frames/' in frame_path:
+        source = get_mp4_from_png_path(frame_path)
+    if source and os.path.exists(source):
+        return get_frame_count(source) or None
+    return None
+
+
+def verify_integrity(folder, full_decode=False, workers=None, report_path='verify_report.json'):
+    """Check every AVIF under folder in a process pool and write a report of missing, corrupt and misnumbered frames."""
+    start = time.time()
+    avif_files = get_all_avifs(folder)
+    cache = load_verify_cache()
+    results = {}
+    to_check = []
+    for avif_path in avif_files:
+        st = os.stat(avif_path)
+        cached = cache.get(avif_path)
+        if cached and cached['size'] == st.st_size and cached['mtime'] == st.st_mtime and (cached['full_decode'] or not full_decode):
+            results[avif_path] = cached
+        else:
+            to_check.append((avif_path, st))
+    logger.info(f'{len(avif_files)} AVIF files, {len(results)} unchanged since the last check, checking {len(to_check)}')
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        checked = executor.map(check_avif, [path for path, _ in to_check], [full_decode] * len(to_check), chunksize=64)
+        for (avif_path, st), result in zip(to_check, checked):
+            result['size'] = st.st_size
+            result['mtime'] = st.st_mtime
+            results[avif_path] = result
+            cache[avif_path] = result
+    os.makedirs(os.path.dirname(VERIFY_CACHE), exist_ok=True)
+    atomic_write_bytes(VERIFY_CACHE, json.dumps(cache).encode())
+
+    # group frames into sequences: same folder and same name apart from the frame number
+    sequences = {}
+    for avif_path in avif_files:
+        frame = parse_frame_path(avif_path).frame
+        if frame is None:
+            continue
+        stem = FRAME_SUFFIX.sub('', os.path.basename(avif_path))
+        sequences.setdefault((os.path.dirname(avif_path), stem), []).append((frame, avif_path))
+
+    report = {'folder': folder, 'checked': len(to_check), 'cached': len(avif_files) - len(to_check),
+              'corrupt': [], 'missing': [], 'bad_numbering': [], 'dimension_mismatch': []}
+    report['corrupt'] = [{'path': r['path'], 'error': r['error']} for r in results.values() if not r['ok']]
+    for (sequence_dir, basename), frames in sorted(sequences.items()):
+        frames.sort()
+        numbers = [frame for frame, _ in frames]
+        expected = expected_frame_count(sequence_dir, basename, frames[0][1])
+        last = expected if expected is not None else numbers[-1] + 1
+        missing = sorted(set(range(last)).difference(numbers))
+        if missing:
+            report['missing'].append({'sequence': os.path.join(sequence_dir, basename), 'expected': expected, 'frames': missing})
+        duplicates = [frame for frame, count in Counter(numbers).items() if count > 1]
+        beyond = [path for frame, path in frames if expected is not None and frame >= expected]
+        # numbering problems: a frame number present twice, or past the end of the source
+        if duplicates or beyond:
+            report['bad_numbering'].append({'sequence': os.path.join(sequence_dir, basename),
+                                            'duplicate_frames': duplicates, 'beyond_source_end': beyond})
+        sizes = Counter((results[path]['width'], results[path]['height']) for _, path in frames if results[path]['ok'])
+        if len(sizes) > 1:
+            common = sizes.most_common(1)[0][0]
+            report['dimension_mismatch'].extend(
+                {'path': path, 'size': [results[path]['width'], results[path]['height']], 'expected': list(common)}
+                for _, path in frames if results[path]['ok'] and (results[path]['width'], results[path]['height']) != common)
+
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    logger.info(f'Verified {len(avif_files)} frames in {len(sequences)} sequences in {time.time() - start:.2f} sec: '
+                f'{len(report["corrupt"])} corrupt, {sum(len(m["frames"]) for m in report["missing"])} missing, '
+                f'{len(report["bad_numbering"])} sequences with bad numbering, {len(report["dimension_mismatch"])} wrong size. '
+                f'Report: {report_path}')
+    return report
+
+
 if __name__ == '__main__':
     #provide access to different functions based on args
     if len(sys.argv) < 2:
-        logger.error('Please provide a folder to check, valid additional args include "png", "avif"')
+        logger.error('Please provide a folder to check, valid additional args include "png", "avif", "verify", "full"')
         sys.exit(1)
     folder = sys.argv[1]
     if not os.path.exists(folder):
@@ -83,13 +200,7 @@ if __name__ == '__main__':
         png_files = get_all_pngs(folder)
         if png_files:
             logger.info(f'Found {len(png_files)} PNG files in {folder}')
-            for png in png_files:
-                print(f'trying to convert {png}')
-                try:
-                    convert_png_to_avif(png)
-                except BaseException as e:
-                    logger.error(f'Error converting {png} to AVIF:\n\t{e}')
-                    pass
+            bulk_convert_png_to_avif(png_files)
         else:
             logger.info(f'No PNG files found in {folder}')
     if 'avif' in sys.argv:
@@ -98,5 +209,7 @@ if __name__ == '__main__':
             logger.info(f'Found {len(avif_files)} AVIF files in {folder}')
         else:
             logger.info(f'No AVIF files found in {folder}')
-
-
+    if 'verify' in sys.argv:
+        report = verify_integrity(folder, full_decode='full' in sys.argv)
+        if report['corrupt'] or report['missing'] or report['bad_numbering']:
+            sys.exit(2)